@@ -0,0 +1,62 @@
+import os
+import sys
+import time
+import resource
+import subprocess
+import pandas as pd
+
+# Load time and peak memory of the sales dashboard's loaders.
+#
+#   python bench_load.py orders.csv
+#
+# Compares the full read_csv the dashboard used to do ("before") with the
+# column-projected, categorical read_sales ("after"). Each loader runs in a
+# fresh Python process, so its peak RSS is not hidden by the other's.
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sales import read_sales
+
+LOADERS = ["before", "after"]
+
+
+# Function to load a file with one of the loaders and return the frame
+def load(loader, path):
+    if loader == "before":
+        return pd.read_csv(path, encoding = "ISO-8859-1")
+    with open(path, "rb") as f:
+        return read_sales(f).frame
+
+
+# Function to get the peak resident memory of this process in bytes
+def peak_rss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # kilobytes on Linux
+
+
+# Function to load a file in this process and print the load time, peak memory and frame size
+def measure(loader, path):
+    baseline = peak_rss()
+    start = time.perf_counter()
+    df = load(loader, path)
+    seconds = time.perf_counter() - start
+    frame_bytes = 0 if df is None else int(df.memory_usage(deep = True).sum())
+    print(seconds, peak_rss() - baseline, frame_bytes)
+
+
+# Function to run each loader in its own process and print a comparison
+def main(path):
+    print(f"{path}: {os.path.getsize(path) / 1024 ** 2:,.1f} MB on disk")
+    print(f"{'loader':<8}{'seconds':>10}{'peak MB':>12}{'frame MB':>12}")
+    for loader in LOADERS:
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), "--measure", loader, path],
+                                capture_output = True, text = True, check = True).stdout
+        seconds, peak, frame_bytes = (float(value) for value in output.split())
+        print(f"{loader:<8}{seconds:>10.2f}{peak / 1024 ** 2:>12,.1f}{frame_bytes / 1024 ** 2:>12,.1f}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "--measure":
+        measure(sys.argv[2], sys.argv[3])
+    elif len(sys.argv) == 2:
+        main(sys.argv[1])
+    else:
+        sys.exit("usage: python bench_load.py orders.csv")
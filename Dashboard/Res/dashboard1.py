@@ -1,10 +1,18 @@
 import streamlit as st
-import plotly.express as px
 import pandas as pd
+import io
 import os
+import sys
 import warnings
 warnings.filterwarnings('ignore')
 
+# Shared helpers live in the Dashboard folder above this one
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from uploads import read_upload
+from exports import export_button
+from sales import load_sales, read_sales, rollup, monthly_sales, SALES_COLUMNS
+from plots import category_bar, region_pie, sales_line, payload_bytes
+
 st.set_page_config(page_title="DataAnalysis!!!", page_icon=":bar_chart:",layout="wide")
 
 st.title(" :bar_chart: Data Analysis")
@@ -14,18 +22,46 @@ fl = st.file_uploader(":file_folder: Upload a file",type=(["csv","txt","xlsx","x
 if fl is not None:
     filename = fl.name
     st.write(filename)
-    df = pd.read_csv(filename, encoding = "ISO-8859-1")
+    # Read only the columns the dashboard uses from the upload, in chunks with
+    # categorical dimensions and compact numbers, within the memory limit
+    progress_bar = st.progress(0.0, text = "Reading file...")
+
+    def parse(f):
+        return read_sales(f, progress = lambda fraction, text: progress_bar.progress(fraction, text = text))
+
+    try:
+        upload = read_upload(fl, parse, variant = "sales", sidecar = False)
+    except ValueError as e:
+        progress_bar.empty()
+        st.error(f"{filename} could not be read, it needs the columns {', '.join(SALES_COLUMNS)}: {e}")
+        st.stop()
+    progress_bar.empty()
+    if upload.frame is not None:
+        st.caption(f"Loaded {upload.rows:,} rows in {upload.seconds:,.1f} s, "
+                   f"{upload.frame_bytes / 1024 ** 2:,.1f} MB in memory")
+    else:
+        # The cube is summed while reading, so the charts work without the orders
+        st.caption(f"Read {upload.rows:,} rows in {upload.seconds:,.1f} s into a sales cube of "
+                   f"{upload.aggregates.nbytes() / 1024 ** 2:,.1f} MB")
+        st.info(f"{filename}'s orders do not fit in the memory limit (set CHUNKED_MEMORY_LIMIT to raise it), "
+                "so dates are matched by whole months.")
+    for col, count in upload.dropped.items():
+        st.warning(f"{count:,} values of {col} are not numbers and were left out.")
 else:
     os.chdir(r"/home/kali/Projects/Dashboard")
-    df = pd.read_csv("test.csv", encoding = "ISO-8859-1")
+    # Read through the upload cache as well, so the default dataset is parsed,
+    # sorted and summed into its cube once rather than on every rerun
+    with open("test.csv", "rb") as f:
+        upload = read_upload(io.BytesIO(f.read()), read_sales, variant = "sales", sidecar = False)
 
 
 col1, col2 = st.columns((2))
-df["Order Date"] = pd.to_datetime(df["Order Date"])
+# Order Date is parsed once and the orders sorted by it, so date ranges are binary searches
+sales = load_sales(upload)
 
 # Getting the min and max date 
-startDate = pd.to_datetime(df["Order Date"]).min()
-endDate = pd.to_datetime(df["Order Date"]).max()
+startDate = sales.first_date()
+endDate = sales.last_date()
 
 with col1:
     date1 = pd.to_datetime(st.date_input("Start Date", startDate))
@@ -33,85 +69,68 @@ with col1:
 with col2:
     date2 = pd.to_datetime(st.date_input("End Date", endDate))
 
-df = df[(df["Order Date"] >= date1) & (df["Order Date"] <= date2)].copy()
-
 st.sidebar.header("Choose your filter: ")
+# Options cascade down the Region -> State -> City hierarchy of the dataset
 # Create for Region
-region = st.sidebar.multiselect("Pick your Region", df["Region"].unique())
-if not region:
-    df2 = df.copy()
-else:
-    df2 = df[df["Region"].isin(region)]
+region = st.sidebar.multiselect("Pick your Region", sales.options("Region"))
 
 # Create for State
-state = st.sidebar.multiselect("Pick the State", df2["State"].unique())
-if not state:
-    df3 = df2.copy()
-else:
-    df3 = df2[df2["State"].isin(state)]
+state = st.sidebar.multiselect("Pick the State", sales.options("State", region))
 
 # Create for the City
-city = st.sidebar.multiselect("Pick the City", df2["City"].unique())
-
-if not region and not state and not city:
-    filtered_df = df
-elif not state and not city:
-    filtered_df = df[df["Region"].isin(region)]
-elif not region and not city:
-    filtered_df = df[df["State"].isin(state)]
-elif state and city:
-    filtered_df = df3[df["State"].isin(state) & df3["City"].isin(city)]
-elif region and city:
-    filtered_df = df3[df["Region"].isin(region) & df3["City"].isin(city)]
-elif region and state:
-    filtered_df = df3[df["Region"].isin(region) & df3["State"].isin(state)]
-elif city:
-    filtered_df = df3[df3["City"].isin(city)]
-else:
-    filtered_df = df3[df3["Region"].isin(region) & df3["State"].isin(state) & df3["City"].isin(city)]
+city = st.sidebar.multiselect("Pick the City", sales.options("City", region, state))
+
+# Sales per (Region, State, City, Category, month) for the chosen dates where
+# every non-empty selection matches; everything below rolls it up
+filtered_cube = sales.query(date1, date2, region, state, city)
 
+# Exports are generated on click and cached by dataset, filters and format
+fingerprint = upload.fingerprint
+filters = (date1, date2, tuple(region), tuple(state), tuple(city))
 
+category_df = rollup(filtered_cube, "Category")
+region_df = rollup(filtered_cube, "Region")
 
-category_df = filtered_df.groupby(by = ["Category"], as_index = False)["Sales"].sum()
+# Bytes of chart data sent to the browser on this run
+chart_bytes = 0
 
 with col1:
     st.subheader("Category wise Sales")
-    fig = px.bar(category_df, x = "Category", y = "Sales", text = ['${:,.2f}'.format(x) for x in category_df["Sales"]],
-                 template = "seaborn")
+    fig = category_bar(category_df)
+    chart_bytes += payload_bytes(fig)
     st.plotly_chart(fig,use_container_width=True, height = 200)
 
 with col2:
     st.subheader("Region wise Sales")
-    fig = px.pie(filtered_df, values = "Sales", names = "Region", hole = 0.5)
-    fig.update_traces(text = filtered_df["Region"], textposition = "outside")
+    fig = region_pie(region_df)
+    chart_bytes += payload_bytes(fig)
     st.plotly_chart(fig,use_container_width=True)
 
 cl1, cl2 = st.columns((2))
 with cl1:
     with st.expander("Category_ViewData"):
         st.write(category_df.style.background_gradient(cmap="Blues"))
-        csv = category_df.to_csv(index = False).encode('utf-8')
-        st.download_button("Download Data", data = csv, file_name = "Category.csv", mime = "text/csv",
-                            help = 'Click here to download the data as a CSV file')
+        export_button(category_df, fingerprint, "Category", filters, key = "category_export",
+                      help = 'Click here to download the data')
 
 with cl2:
     with st.expander("Region_ViewData"):
-        region = filtered_df.groupby(by = "Region", as_index = False)["Sales"].sum()
-        st.write(region.style.background_gradient(cmap="Oranges"))
-        csv = region.to_csv(index = False).encode('utf-8')
-        st.download_button("Download Data", data = csv, file_name = "Region.csv", mime = "text/csv",
-                        help = 'Click here to download the data as a CSV file')
+        st.write(region_df.style.background_gradient(cmap="Oranges"))
+        export_button(region_df, fingerprint, "Region", filters, key = "region_export",
+                      help = 'Click here to download the data')
         
-filtered_df["month_year"] = filtered_df["Order Date"].dt.to_period("M")
 st.subheader('Time Series Analysis')
 
-linechart = pd.DataFrame(filtered_df.groupby(filtered_df["month_year"].dt.strftime("%Y : %b"))["Sales"].sum()).reset_index()
-fig2 = px.line(linechart, x = "month_year", y="Sales", labels = {"Sales": "Amount"},height=500, width = 1000,template="gridon")
+# Monthly sales in date order, summed over the cube rows by month key
+linechart = monthly_sales(filtered_cube)
+fig2 = sales_line(linechart)
+chart_bytes += payload_bytes(fig2)
 st.plotly_chart(fig2,use_container_width=True)
 
 with st.expander("View Data of TimeSeries:"):
     st.write(linechart.T.style.background_gradient(cmap="Blues"))
-    csv = linechart.to_csv(index=False).encode("utf-8")
-    st.download_button('Download Data', data = csv, file_name = "TimeSeries.csv", mime ='text/csv')
+    export_button(linechart, fingerprint, "TimeSeries", filters, key = "timeseries_export")
+
+st.caption(f"Chart data sent this run: {chart_bytes / 1024:,.1f} KB")
 
 # Create a treem based on Region, category, sub-Category
@@ -0,0 +1,40 @@
+import os
+import plotly.express as px
+
+# Plotly charts for the sales dashboard.
+#
+# Every chart is built from an already aggregated frame (rolled up from the
+# sales cube), so what is sent to the browser grows with the number of
+# categories, regions or months, never with the number of orders. Labels are
+# formatted by Plotly from the values (texttemplate/textinfo) instead of
+# being sent as a list of strings per point. Numeric columns are passed as
+# NumPy arrays, which Plotly encodes as compact base64 typed arrays.
+
+# Line charts with more points than this are drawn with WebGL (scattergl)
+WEBGL_POINTS = int(os.environ.get('WEBGL_POINTS', 1000))
+
+
+# Function to draw the sales per category as bars labelled with their amount
+def category_bar(category_df):
+    fig = px.bar(category_df, x = "Category", y = "Sales", template = "seaborn")
+    fig.update_traces(texttemplate = "$%{y:,.2f}")
+    return fig
+
+
+# Function to draw the share of sales per region as a donut, labelled with the region names
+def region_pie(region_df):
+    fig = px.pie(region_df, values = "Sales", names = "Region", hole = 0.5)
+    fig.update_traces(textinfo = "label", textposition = "outside")
+    return fig
+
+
+# Function to draw the monthly sales; long series switch to WebGL
+def sales_line(linechart):
+    render_mode = "webgl" if len(linechart) > WEBGL_POINTS else "svg"
+    return px.line(linechart, x = "month_year", y = "Sales", labels = {"Sales": "Amount"}, height = 500, width = 1000,
+                   template = "gridon", render_mode = render_mode)
+
+
+# Function to get the size in bytes of the JSON a figure is sent to the browser as
+def payload_bytes(fig):
+    return len(fig.to_json().encode("utf-8"))
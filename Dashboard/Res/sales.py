@@ -0,0 +1,280 @@
+import os
+import time
+import calendar
+import numpy as np
+import pandas as pd
+from uploads import FrameCache
+from chunked import read_csv_chunked, combine_chunks
+
+# Sales cube for the sales dashboard.
+#
+# Orders are summed once per dataset into a cube with one row per
+# (Region, State, City, Category, month). The dashboard's filters and charts
+# are answered by rolling up the cube, so their cost depends on the number
+# of groups rather than the number of orders. Only the first and last month
+# of a date range that starts or ends mid-month are summed from the orders
+# themselves.
+#
+# The orders are kept sorted by Order Date (parsed once per dataset), so the
+# orders of a date range are found by binary search and taken as a slice.
+# They are sorted while the upload is parsed, so the upload cache holds the
+# only copy; the sales cache keeps just the cube and its filter masks.
+# The cube is sorted by month for the same reason. Region/State/City
+# selections are resolved with boolean masks over the cube, one per value,
+# built the first time the value is selected and kept with the dataset.
+#
+# Months are integer keys (year * 12 + month - 1) computed once when the
+# orders are loaded, so the monthly series is a bincount over the cube rows.
+#
+# Only the columns above are parsed from the uploaded file, with the text
+# dimensions dictionary encoded (categorical) as they are read and Sales
+# downcast, which keeps multi-GB order exports to a fraction of their size.
+#
+# The cube is summed chunk by chunk while the file is read. When the orders
+# do not fit in the chunked reader's memory limit only the cube is kept, and
+# date ranges are then widened to whole months.
+
+DIMENSIONS = ["Region", "State", "City", "Category"]
+LEVELS = ["Region", "State", "City"]
+# Columns the dashboard uses; the rest of the file is skipped while parsing
+SALES_COLUMNS = ["Order Date"] + DIMENSIONS + ["Sales"]
+SALES_DTYPES = {dimension: "category" for dimension in DIMENSIONS}
+SALES_CACHE_BYTES = int(os.environ.get('SALES_CACHE_BYTES', 512 * 1024 * 1024))
+
+_datasets = FrameCache(SALES_CACHE_BYTES)
+
+
+# Function to get the integer month key of a date (or of a Series' .dt accessor)
+def month_key(date):
+    return date.year * 12 + date.month - 1
+
+
+# Function to get the first day of the month of a month key
+def month_start(key):
+    return pd.Timestamp(year=int(key) // 12, month=int(key) % 12 + 1, day=1)
+
+
+# Function to get the label of a month key, e.g. "2023 : Jan"
+def month_label(key):
+    return f"{key // 12} : {calendar.month_abbr[key % 12 + 1]}"
+
+
+# Sales cube and date span summed chunk by chunk while a file is read
+class SalesAggregates:
+    def __init__(self):
+        self.cube = None
+        self.parts = []  # Cubes of the chunks read since the last merge
+        self.first_date = None
+        self.last_date = None
+
+    def update(self, chunk, dtypes):
+        orders = date_orders(chunk)
+        if orders.empty:
+            return
+        dates = orders["Order Date"]
+        self.first_date = dates.min() if self.first_date is None else min(self.first_date, dates.min())
+        self.last_date = dates.max() if self.last_date is None else max(self.last_date, dates.max())
+        self.parts.append(aggregate_sales(orders))
+        # Merging once the parts outgrow the cube keeps the total work linear
+        if sum(len(part) for part in self.parts) >= (0 if self.cube is None else len(self.cube)):
+            self.merge()
+
+    # Function to sum the chunk cubes into the cube, and sort it by month at the end of the file
+    def finish(self):
+        self.cube = self.merge().sort_values("month_key", kind="stable", ignore_index=True)
+
+    # Function to sum the chunk cubes into the cube
+    def merge(self):
+        parts = ([] if self.cube is None else [self.cube]) + self.parts
+        if not parts:
+            parts = [pd.DataFrame(columns=DIMENSIONS + ["month_key", "Sales", "Orders"])]
+        cube = combine_chunks(parts).groupby(DIMENSIONS + ["month_key"], observed=True, dropna=False, sort=False)
+        self.cube = cube[["Sales", "Orders"]].sum().reset_index()
+        self.parts = []
+        return self.cube
+
+    def nbytes(self):
+        frames = ([] if self.cube is None else [self.cube]) + self.parts
+        return int(sum(frame.memory_usage(deep=True).sum() for frame in frames))
+
+
+# Function to read the dashboard's columns of a sales CSV file object in chunks
+# The rows come back as prepared orders, so only the sorted copy is kept, and
+# upload.aggregates holds the sales cube (also when the rows are not kept)
+# progress(fraction, text) is called after every chunk
+def read_sales(file, progress=None):
+    start = time.perf_counter()
+    upload = read_csv_chunked(file, progress=progress, aggregates=SalesAggregates(), encoding="ISO-8859-1",
+                              usecols=SALES_COLUMNS, dtype=SALES_DTYPES, parse_dates=["Order Date"])
+    upload.aggregates.finish()
+    if upload.frame is not None:
+        upload.frame = prepare_orders(upload.frame)
+        upload.frame_bytes = int(upload.frame.memory_usage(deep=True).sum())
+        upload.seconds = time.perf_counter() - start
+    return upload
+
+
+# Function to parse the dates of orders and add their month keys
+# Orders without a date are left out, they never fall in a date range
+def date_orders(df):
+    dates = pd.to_datetime(df["Order Date"])
+    orders = df.assign(**{"Order Date": dates})[dates.notna()]
+    orders["month_key"] = month_key(orders["Order Date"].dt).astype("int32")
+    return orders
+
+
+# Function to parse, clean and sort orders, and add their month keys
+def prepare_orders(df):
+    if "month_key" in df.columns:
+        return df  # Prepared by read_sales already
+    return date_orders(df).sort_values("Order Date", kind="stable", ignore_index=True)
+
+
+# Function to sum the sales of some prepared orders per dimension values and month
+# Downcast (float32) sales are summed as float64; integer sums are int64 already
+def aggregate_sales(orders):
+    sales = orders["Sales"]
+    if pd.api.types.is_float_dtype(sales):
+        sales = sales.astype("float64")
+    cube = sales.groupby([orders[column] for column in DIMENSIONS + ["month_key"]], observed=True, dropna=False).agg(["sum", "count"])
+    return cube.rename(columns={"sum": "Sales", "count": "Orders"}).reset_index()
+
+
+# Function to get the sorted orders from start (inclusive) to end (exclusive) without copying them
+def date_range(orders, start, end):
+    dates = orders["Order Date"].to_numpy()
+    bounds = np.array([pd.Timestamp(start), pd.Timestamp(end)], dtype='datetime64[ns]').astype(dates.dtype)
+    low, high = np.searchsorted(dates, bounds)
+    return orders.iloc[low:high]
+
+
+# Function to keep the rows of a (small) cube matching the selected Region, State and City values
+# An empty selection does not filter
+def select(cube, region=(), state=(), city=()):
+    mask = pd.Series(True, index=cube.index)
+    for column, values in (("Region", region), ("State", state), ("City", city)):
+        if values:
+            mask &= cube[column].isin(values)
+    return cube[mask]
+
+
+# Function to sum the cube's sales per value of some columns
+def rollup(cube, by):
+    return cube.groupby(by, observed=True, as_index=False)["Sales"].sum()
+
+
+# Function to get the cube's sales per month in date order, as "month_year" labels and "Sales"
+# Only months with orders are listed
+def monthly_sales(cube):
+    keys = cube["month_key"].to_numpy()
+    if len(keys) == 0:
+        return pd.DataFrame({"month_year": [], "Sales": []})
+    first = keys.min()
+    totals = np.bincount(keys - first, weights=cube["Sales"].to_numpy(dtype=float))
+    months = np.flatnonzero(np.bincount(keys - first)) + first
+    sales = totals[months - first]
+    if pd.api.types.is_integer_dtype(cube["Sales"]):
+        sales = sales.round().astype("int64")
+    return pd.DataFrame({"month_year": [month_label(key) for key in months], "Sales": sales})
+
+
+# Cube, date span, filter hierarchy and filter masks of one dataset
+# Cached without the orders, which the upload cache holds, so it fits the cache budget
+class SalesCube:
+    def __init__(self, aggregates, fingerprint=None):
+        self.fingerprint = fingerprint
+        self.cube = aggregates.cube  # Month-sorted, shared with the upload
+        self.first_date = aggregates.first_date
+        self.last_date = aggregates.last_date
+        # Region -> State -> City, for the cascading option lists
+        self.hierarchy = self.cube[LEVELS].drop_duplicates().dropna().reset_index(drop=True)
+        self.codes = {level: pd.factorize(self.cube[level]) for level in LEVELS}
+        self.masks = {}  # (level, value) -> boolean mask over the cube rows
+
+    def nbytes(self):
+        frames = int(self.cube.memory_usage(deep=True).sum() + self.hierarchy.memory_usage(deep=True).sum())
+        return frames + len(self.cube) * len(self.masks)
+
+    # Function to get the values of a level to pick from, within the selected parent values
+    def options(self, level, region=(), state=()):
+        rows = self.hierarchy
+        if region and level != "Region":
+            rows = rows[rows["Region"].isin(region)]
+        if state and level == "City":
+            rows = rows[rows["State"].isin(state)]
+        return list(pd.unique(rows[level]))
+
+    # Function to get the cached mask of the cube rows holding one value of a level
+    def value_mask(self, level, value):
+        if (level, value) not in self.masks:
+            codes, values = self.codes[level]
+            matches = np.flatnonzero(values == value)
+            self.masks[(level, value)] = codes == matches[0] if len(matches) else np.zeros(len(codes), dtype=bool)
+            if self.fingerprint is not None:
+                _datasets.put(self.fingerprint, self)  # Update its size in the cache
+        return self.masks[(level, value)]
+
+    # Function to combine the cached masks of a selection: OR within a level, AND across levels
+    # Returns None when nothing is selected
+    def selection_mask(self, region=(), state=(), city=()):
+        mask = None
+        for level, values in zip(LEVELS, (region, state, city)):
+            if values:
+                level_mask = np.logical_or.reduce([self.value_mask(level, value) for value in values])
+                mask = level_mask if mask is None else mask & level_mask
+        return mask
+
+
+# Sorted orders of one dataset with its cube
+# orders is None when they did not fit in memory; dates are then matched by whole months
+class SalesData:
+    def __init__(self, orders, cube):
+        self.orders = orders
+        self.cube = cube
+
+    def first_date(self):
+        return self.cube.first_date
+
+    def last_date(self):
+        return self.cube.last_date
+
+    def whole_months(self):
+        return self.orders is None
+
+    # Function to get the values of a level to pick from, within the selected parent values
+    def options(self, level, region=(), state=()):
+        return self.cube.options(level, region, state)
+
+    # Function to get the cube rows for the orders from start to end (both whole days) in the selection
+    # Months fully inside the range are a slice of the month-sorted cube; the
+    # partly covered first and last months are summed from the orders of those days
+    def query(self, start, end, region=(), state=(), city=()):
+        start, end = pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize()
+        first_full = month_key(start) if start.day == 1 or self.whole_months() else month_key(start) + 1
+        last_full = month_key(end) if end.is_month_end or self.whole_months() else month_key(end) - 1
+
+        parts = []
+        if first_full <= last_full:
+            low, high = self.cube.cube["month_key"].searchsorted([first_full, last_full + 1])
+            rows = self.cube.cube.iloc[low:high]
+            mask = self.cube.selection_mask(region, state, city)
+            parts.append(rows if mask is None else rows[mask[low:high]])
+            edges = [(start, month_start(first_full)), (month_start(last_full + 1), end + pd.Timedelta(days=1))]
+        else:
+            edges = [(start, end + pd.Timedelta(days=1))]
+        for low, high in edges:
+            if low < high and not self.whole_months():
+                parts.append(select(aggregate_sales(date_range(self.orders, low, high)), region, state, city))
+        return pd.concat(parts, ignore_index=True) if parts else self.cube.cube.iloc[:0]
+
+
+# Function to get the sales data of an upload read with read_sales
+# Its cube is indexed once and shared by fingerprint
+def load_sales(upload):
+    fingerprint = upload.fingerprint
+    cube = _datasets.get(fingerprint) if fingerprint is not None else None
+    if cube is None:
+        cube = SalesCube(upload.aggregates, fingerprint)
+        if fingerprint is not None:
+            _datasets.put(fingerprint, cube)
+    return SalesData(upload.frame, cube)
@@ -0,0 +1,163 @@
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+import seaborn as sns
+from matplotlib.figure import Figure
+from summaries import stratified_sample
+
+# Chart drawing for the Graph View apps.
+#
+# Each draw_* function takes the data and chart options and returns a new
+# matplotlib Figure. Figures are built with the object-oriented API rather
+# than pyplot, so they never enter pyplot's global figure list and are freed
+# as soon as figcache.py has saved them as an image.
+
+# z value for the 95% error bars of the aggregated bar chart
+Z_95 = 1.96
+
+
+# Function to aggregate the Y columns per X value with a single groupby
+# Returns the bar heights and, when error_bars is set, the half width of a
+# 95% confidence interval (normal approximation) for each bar
+def aggregate_groups(df, x_column, y_columns, statistic, error_bars):
+    values = df[y_columns].apply(pd.to_numeric, errors='coerce')
+    stats = values.groupby(df[x_column], observed=True).agg(['sum', 'count', 'std'])
+    sums = stats.xs('sum', axis=1, level=1)
+    counts = stats.xs('count', axis=1, level=1)
+    if statistic == 'count':
+        heights = counts
+    elif statistic == 'sum':
+        heights = sums
+    else:
+        heights = sums / counts.where(counts > 0)
+
+    errors = None
+    if error_bars and statistic != 'count':
+        std = stats.xs('std', axis=1, level=1)
+        scale = np.sqrt(counts) if statistic == 'sum' else 1 / np.sqrt(counts.where(counts > 0))
+        errors = Z_95 * std * scale
+    return heights, errors
+
+
+# Function to set the labels and title of a chart
+def label_axes(ax, xlabel, ylabel, title):
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    ax.set_title(title)
+
+
+# Function to draw one group of bars per X value, one bar per Y column
+def draw_grouped_bars(df, x_column, y_columns, statistic, error_bars, title):
+    heights, errors = aggregate_groups(df, x_column, y_columns, statistic, error_bars)
+    fig = Figure(figsize=(10, 6))
+    ax = fig.subplots()
+    positions = np.arange(len(heights))
+    width = 0.8 / max(1, len(heights.columns))
+    for i, col in enumerate(heights.columns):
+        offset = (i - (len(heights.columns) - 1) / 2) * width
+        yerr = None if errors is None else errors[col].fillna(0).to_numpy()
+        ax.bar(positions + offset, heights[col].to_numpy(), width, yerr=yerr, capsize=3, label=col)
+    ax.set_xticks(positions)
+    rotate = len(heights) > 10
+    ax.set_xticklabels(heights.index.astype(str), rotation=45 if rotate else 0, ha='right' if rotate else 'center')
+    label_axes(ax, x_column, f"{statistic} of {', '.join(y_columns)}", title)
+    ax.legend()
+    return fig
+
+
+# Function to draw seaborn bar plots (mean with bootstrapped confidence interval) of each Y column
+def draw_seaborn_bars(df, x_column, y_columns, title):
+    fig = Figure(figsize=(10, 6))
+    ax = fig.subplots()
+    for y_col in y_columns:
+        sns.barplot(x=x_column, y=df[y_col], data=df, ax=ax, label=y_col)
+    label_axes(ax, x_column, ", ".join(y_columns), title)
+    ax.legend()
+    return fig
+
+
+# Function to draw seaborn bar plot of y against x
+def draw_bar(x_values, y_values, title):
+    fig = Figure(figsize=(10, 6))
+    ax = fig.subplots()
+    sns.barplot(x=x_values, y=y_values, ax=ax)
+    label_axes(ax, x_values.name, y_values.name, title)
+    return fig
+
+
+# Function to draw a bar per group from already aggregated values
+def draw_value_bars(values, xlabel, ylabel, title):
+    fig = Figure(figsize=(10, 6))
+    ax = fig.subplots()
+    ax.bar(values.index.astype(str), values.to_numpy())
+    label_axes(ax, xlabel, ylabel, title)
+    return fig
+
+
+# Function to draw a line chart of y against x
+def draw_line(x_values, y_values, title):
+    fig = Figure(figsize=(10, 6))
+    ax = fig.subplots()
+    ax.plot(x_values, y_values, marker='o')
+    label_axes(ax, x_values.name, y_values.name, title)
+    return fig
+
+
+# Function to draw a scatter plot of y against x
+def draw_scatter(x_values, y_values, title):
+    fig = Figure(figsize=(10, 6))
+    ax = fig.subplots()
+    ax.scatter(x_values, y_values)
+    label_axes(ax, x_values.name, y_values.name, title)
+    return fig
+
+
+# Function to draw a correlation heatmap
+def draw_heatmap(corr, title):
+    fig = Figure(figsize=(10, 8))
+    ax = fig.subplots()
+    sns.heatmap(corr, annot=True, cmap='coolwarm', vmin=-1, vmax=1, ax=ax)
+    ax.set_title(title)
+    return fig
+
+
+# Function to draw a histogram from pre-binned counts
+# With unequal bin widths (quantile bins) the bar heights show density instead of counts
+def draw_histogram(edges, counts, column, title):
+    fig = Figure(figsize=(10, 6))
+    ax = fig.subplots()
+    widths = np.diff(edges)
+    if np.allclose(widths, widths[0]):
+        heights, ylabel = counts, "Frequency"
+    else:
+        heights, ylabel = counts / max(1, counts.sum()) / widths, "Density"
+    ax.bar(edges[:-1], heights, width=widths, align='edge', edgecolor='black')
+    label_axes(ax, column, ylabel, title)
+    return fig
+
+
+# Function to draw a seaborn pairplot of some numeric columns
+# Above sample_rows rows a stratified sample is drawn and its size is put in the title.
+# pairplot always makes its own pyplot figure, figcache closes it after saving
+def draw_pairplot(df, columns, sample_rows, stratify, title):
+    sample = stratified_sample(df, sample_rows, stratify)
+    if len(sample) < len(df):
+        title = f"{title} (sample of {len(sample):,} of {len(df):,} rows"
+        title += f", stratified by {stratify})" if stratify else ")"
+    grid = sns.pairplot(sample, vars=columns)
+    grid.figure.suptitle(title, y=1.02)
+    return grid.figure
+
+
+# Function to draw a pie chart from value counts
+def draw_pie(counts, title):
+    fig = Figure(figsize=(8, 8))
+    ax = fig.subplots()
+    ax.pie(counts, labels=counts.index, autopct='%1.1f%%', startangle=140)
+    ax.set_title(title)
+    return fig
+
+
+# Function to close a figure from draw_* once it is no longer needed
+def close_figure(fig):
+    plt.close(fig)
@@ -0,0 +1,66 @@
+import io
+from chunked import read_csv_chunked
+
+# Checks for chunked ingestion with chunks that do not match the first one.
+#
+#   python check_chunked.py
+#
+# Reads small CSV files in chunks of 5 rows, so later chunks can hold text
+# in a numeric column or blanks in a categorical one, and checks the kept
+# rows, the aggregates and the dropped value counts.
+
+CHUNK_ROWS = 5
+
+
+# Function to read CSV text in chunks of CHUNK_ROWS rows
+def read(text, **kwargs):
+    return read_csv_chunked(io.BytesIO(text.encode()), chunk_rows=CHUNK_ROWS, **kwargs)
+
+
+# Function to make a 16 row CSV with a category and a value column; rows maps row numbers to replacement lines
+def orders_csv(rows=None):
+    lines = [f"{'ab'[i % 2]},{i}" for i in range(16)]
+    for i, line in (rows or {}).items():
+        lines[i] = line
+    return "\n".join(["cat,val"] + lines)
+
+
+# Text in a numeric column in a later chunk is left out of the rows and the sums, and counted
+def check_text_in_numeric_column():
+    upload = read(orders_csv({10: "a,oops"}))
+    assert upload.rows == 16
+    assert upload.dropped == {"val": 1}
+    assert upload.frame["val"].isna().sum() == 1
+    assert upload.aggregates.group_stats["cat"].loc["a", ("val", "sum")] == sum(range(0, 16, 2)) - 10
+    assert upload.aggregates.value_counts["cat"].sum() == 16
+
+
+# The same file over the memory limit still gives the aggregates
+def check_text_in_numeric_column_over_limit():
+    upload = read(orders_csv({10: "a,oops"}), memory_limit=1)
+    assert upload.frame is None
+    assert upload.dropped == {"val": 1}
+    assert upload.aggregates.group_stats["cat"].loc["b", ("val", "sum")] == sum(range(1, 16, 2))
+
+
+# A chunk whose category column is blank gets float categories, they are combined as text
+def check_blank_categories():
+    upload = read(orders_csv({i: f",{i}" for i in range(5, 10)}))
+    assert upload.frame["cat"].isna().sum() == 5
+    assert upload.frame["cat"].value_counts()["a"] == 6
+
+
+# A file without surprises drops nothing
+def check_clean_file():
+    upload = read(orders_csv())
+    assert upload.dropped == {}
+    assert upload.frame["val"].sum() == sum(range(16))
+
+
+CHECKS = [check_text_in_numeric_column, check_text_in_numeric_column_over_limit,
+          check_blank_categories, check_clean_file]
+
+if __name__ == "__main__":
+    for check in CHECKS:
+        check()
+        print(f"ok  {check.__name__}")
@@ -0,0 +1,166 @@
+import os
+import time
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+# Chunked ingestion for large CSV uploads.
+#
+# The file is read CHUNK_ROWS rows at a time. Dtypes are picked from the
+# first chunk: low-cardinality text becomes categorical and numbers are
+# downcast, so the kept rows take a fraction of what read_csv would use.
+# While reading, the aggregates the charts need (value counts and per-group
+# sums/counts) are built incrementally. If the compact rows grow past the
+# memory limit they are dropped and only the aggregates are kept.
+#
+# A column that is numeric in the first chunk stays numeric: values in later
+# chunks that are not numbers (e.g. stray text) are read as missing and
+# counted per column in ChunkedUpload.dropped.
+
+CHUNK_ROWS = int(os.environ.get('CHUNK_ROWS', 200000))
+MEMORY_LIMIT_BYTES = int(os.environ.get('CHUNKED_MEMORY_LIMIT', 2 * 1024 * 1024 * 1024))
+
+# Text columns with at most this share of distinct values (in the first chunk) become categoricals
+CATEGORY_MAX_RATIO = 0.5
+
+
+# Aggregates built chunk by chunk for the charts
+#   value_counts[col]   rows per value of a categorical column
+#   group_stats[col]    sum and count of every numeric column per value of col
+class ChunkAggregates:
+    def __init__(self):
+        self.value_counts = {}
+        self.group_stats = {}
+
+    def update(self, chunk, dtypes):
+        categories = [col for col, kind in dtypes.items() if kind == 'category']
+        numbers = [col for col, kind in dtypes.items() if kind in ('integer', 'float')]
+        for col in categories:
+            counts = chunk[col].value_counts()
+            counts.index = counts.index.astype(object)
+            self.value_counts[col] = add_aligned(self.value_counts.get(col), counts)
+            if numbers:
+                stats = chunk.groupby(col, observed=True)[numbers].agg(['sum', 'count'])
+                stats.index = stats.index.astype(object)
+                self.group_stats[col] = add_aligned(self.group_stats.get(col), stats)
+
+    def nbytes(self):
+        counts_bytes = sum(counts.memory_usage(deep=True) for counts in self.value_counts.values())
+        stats_bytes = sum(stats.memory_usage(deep=True).sum() for stats in self.group_stats.values())
+        return int(counts_bytes + stats_bytes)
+
+
+# Function to add two partial aggregates, matching them up by group
+def add_aligned(total, part):
+    return part.astype('float64') if total is None else total.add(part, fill_value=0)
+
+
+# Result of a chunked read; frame is None when the rows did not fit in the memory limit
+class ChunkedUpload:
+    def __init__(self, frame, aggregates, rows, frame_bytes, seconds=None, dropped=None):
+        self.frame = frame
+        self.aggregates = aggregates
+        self.rows = rows
+        self.frame_bytes = frame_bytes
+        self.seconds = seconds  # How long the read took
+        self.dropped = dropped or {}  # column -> values that were not numbers
+        self.fingerprint = None  # Set by read_upload
+
+    def nbytes(self):
+        return self.frame_bytes + self.aggregates.nbytes()
+
+
+# Function to choose compact dtypes for each column from the first chunk
+def sniff_dtypes(sample, parse_dates=()):
+    dtypes = {}
+    for col in sample.columns:
+        series = sample[col]
+        if col in parse_dates or pd.api.types.is_bool_dtype(series):
+            continue
+        if pd.api.types.is_integer_dtype(series):
+            dtypes[col] = 'integer'
+        elif pd.api.types.is_float_dtype(series):
+            dtypes[col] = 'float'
+        elif series.nunique() <= CATEGORY_MAX_RATIO * max(1, len(series)):
+            dtypes[col] = 'category'
+    return dtypes
+
+
+# Function to convert a chunk to the sniffed dtypes
+# Values of a numeric column that are not numbers become missing; how many
+# per column is added to dropped
+def compact_chunk(chunk, dtypes, dropped=None):
+    for col, kind in dtypes.items():
+        if col not in chunk.columns:
+            continue
+        if kind == 'category':
+            chunk[col] = chunk[col].astype('category')
+            continue
+        values = chunk[col]
+        if not pd.api.types.is_numeric_dtype(values):
+            values = pd.to_numeric(chunk[col], errors='coerce')
+            bad = int((values.isna() & chunk[col].notna()).sum())
+            if bad and dropped is not None:
+                dropped[col] = dropped.get(col, 0) + bad
+        chunk[col] = pd.to_numeric(values, downcast=kind)
+    return chunk
+
+
+# Function to join compact chunks, merging the categories of categorical columns
+def combine_chunks(chunks):
+    if not chunks:
+        return pd.DataFrame()
+    columns = list(chunks[0].columns)
+    categorical = [col for col in columns
+                   if all(isinstance(chunk[col].dtype, pd.CategoricalDtype) for chunk in chunks)]
+    frame = pd.concat([chunk.drop(columns=categorical) for chunk in chunks], ignore_index=True)
+    for col in categorical:
+        parts = [chunk[col] for chunk in chunks]
+        if len({part.cat.categories.dtype for part in parts}) > 1:
+            # A chunk that was blank or looked numeric got float categories, turn them all into text
+            parts = [part.cat.rename_categories(part.cat.categories.astype(str)) for part in parts]
+        frame[col] = union_categoricals(parts)
+    return frame[columns]
+
+
+# Function to read a CSV file object in chunks
+# progress(fraction, text) is called after every chunk; aggregates collects
+# what the charts need from every chunk (anything with update(chunk, dtypes)
+# and nbytes(), a ChunkAggregates by default); extra keyword arguments go to
+# pd.read_csv (e.g. encoding, parse_dates, usecols)
+def read_csv_chunked(file, chunk_rows=CHUNK_ROWS, memory_limit=MEMORY_LIMIT_BYTES, progress=None, aggregates=None,
+                     **read_csv_kwargs):
+    start = time.perf_counter()
+    file.seek(0, os.SEEK_END)
+    total_bytes = max(1, file.tell())
+    file.seek(0)
+
+    parse_dates = read_csv_kwargs.get('parse_dates') or ()
+    aggregates = ChunkAggregates() if aggregates is None else aggregates
+    chunks = []
+    frame_bytes = 0
+    rows = 0
+    dtypes = None
+    dropped = {}
+    over_limit = False
+    for chunk in pd.read_csv(file, chunksize=chunk_rows, **read_csv_kwargs):
+        if dtypes is None:
+            dtypes = sniff_dtypes(chunk, parse_dates)
+        chunk = compact_chunk(chunk, dtypes, dropped)
+        aggregates.update(chunk, dtypes)
+        rows += len(chunk)
+
+        if not over_limit:
+            frame_bytes += int(chunk.memory_usage(deep=True).sum())
+            if frame_bytes > memory_limit:
+                # Keep going for the aggregates, but stop holding rows
+                over_limit = True
+                chunks = []
+                frame_bytes = 0
+            else:
+                chunks.append(chunk)
+
+        if progress is not None:
+            progress(min(file.tell() / total_bytes, 1.0), f"Read {rows:,} rows")
+
+    frame = None if over_limit else combine_chunks(chunks)
+    return ChunkedUpload(frame, aggregates, rows, frame_bytes, time.perf_counter() - start, dropped)
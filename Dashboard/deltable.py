@@ -1,17 +1,20 @@
 import streamlit as st
-import pandas as pd
 import os
+from storage import get_store, apply_op
 
-# Function to create directory and Excel file if they do not exist
+# Function to create the data directory if it does not exist
 def create_directory_and_file():
     if not os.path.exists('data'):
         os.makedirs('data')
         st.write("Created directory: data")
 
-    if not os.path.exists('data/data.xlsx'):
-        df = pd.DataFrame()
-        df.to_excel('data/data.xlsx', index=False)
-        st.write("Created new Excel file: data.xlsx")
+# Function to describe a staged change for the pending list
+def describe_change(op):
+    if op['op'] == 'add_columns':
+        return f"Add columns: {', '.join(op['columns'])}"
+    if op['op'] == 'drop_columns':
+        return f"Delete columns: {', '.join(op['columns'])}"
+    return f"Add {len(op['rows'])} rows"
 
 def main():
     st.title("Dynamic Data Entry to Excel")
@@ -19,8 +22,17 @@ def main():
     # Create directory and file if they do not exist
     create_directory_and_file()
 
-    # Load existing data from data.xlsx or initialize an empty DataFrame
-    df = pd.read_excel('data/data.xlsx') if os.path.exists('data/data.xlsx') else pd.DataFrame()
+    # Load existing data from the store (imports data.xlsx on first use)
+    store = get_store()
+    df = store.load()
+
+    # Changes are staged here and written as one transaction on "Apply Changes"
+    if 'pending_changes' not in st.session_state:
+        st.session_state.pending_changes = []
+    pending = st.session_state.pending_changes
+
+    # The table as it will look once the pending changes are applied
+    preview = apply_op(df, {'op': 'batch', 'ops': pending}) if pending else df
 
     # Allow user to input columns
     st.header("Add or Delete Columns in Excel")
@@ -29,31 +41,24 @@ def main():
     num_cols_add = st.number_input("Number of Columns to Add", min_value=0, step=1)
 
     if num_cols_add > 0:
-        new_columns = []
-        for i in range(num_cols_add):
-            col_name = st.text_input(f"Enter name for Column {i+1}:")
-            if col_name:
-                new_columns.append(col_name)
-
-        if new_columns:
-            # Add new columns to DataFrame
-            for col in new_columns:
-                df[col] = None  # Initialize new columns with None values
-
-            # Save updated DataFrame with new columns to data.xlsx
-            df.to_excel('data/data.xlsx', index=False)
-            st.write(f"Added {num_cols_add} new columns to data.xlsx")
+        with st.form(key='add_columns_form', clear_on_submit=True):
+            new_columns = []
+            for i in range(num_cols_add):
+                col_name = st.text_input(f"Enter name for Column {i+1}:", key=f"col_{i}")
+                if col_name and col_name not in preview.columns:
+                    new_columns.append(col_name)
+
+            if st.form_submit_button("Stage Columns") and new_columns:
+                # New columns are initialized with None values
+                pending.append({'op': 'add_columns', 'columns': new_columns, 'default': None})
+                st.rerun()
 
     # Input for columns to delete
-    cols_to_delete = st.multiselect("Select Columns to Delete", df.columns.tolist())
-
-    if cols_to_delete:
-        # Remove selected columns from DataFrame
-        df = df.drop(columns=cols_to_delete, errors='ignore')
-
-        # Save updated DataFrame without deleted columns to data.xlsx
-        df.to_excel('data/data.xlsx', index=False)
-        st.write(f"Deleted columns: {', '.join(cols_to_delete)} from data.xlsx")
+    with st.form(key='delete_columns_form', clear_on_submit=True):
+        cols_to_delete = st.multiselect("Select Columns to Delete", preview.columns.tolist())
+        if st.form_submit_button("Stage Deletion") and cols_to_delete:
+            pending.append({'op': 'drop_columns', 'columns': cols_to_delete})
+            st.rerun()
 
     # Display section for adding rows
     st.header("Add Rows to Excel")
@@ -61,31 +66,43 @@ def main():
     # Input for number of rows
     num_rows = st.number_input("Number of Rows to Add", min_value=1, step=1)
 
-    if num_rows > 0:
-        new_data = []
-        for i in range(num_rows):
-            row_data = {}
-            for col in df.columns:
-                value = st.text_input(f"Enter value for {col} (Row {i+1}):", key=f"{col}_{i}")
-                row_data[col] = value
-            new_data.append(row_data)
-        
-        # Convert new data to DataFrame
-        new_df = pd.DataFrame(new_data)
-
-        # Append new data to existing DataFrame if it exists, otherwise use new_df
-        if df.empty:
-            df = new_df
-        else:
-            df = pd.concat([df, new_df], ignore_index=True)
-
-        # Save updated DataFrame to data.xlsx
-        df.to_excel('data/data.xlsx', index=False)
-        st.write(f"Appended {num_rows} rows of data to data.xlsx")
-
-    # Display the updated DataFrame
-    st.header("Updated DataFrame in data.xlsx")
-    st.write(df)
+    if num_rows > 0 and len(preview.columns) > 0:
+        with st.form(key='add_rows_form', clear_on_submit=True):
+            new_data = []
+            for i in range(num_rows):
+                row_data = {}
+                for col in preview.columns:
+                    value = st.text_input(f"Enter value for {col} (Row {i+1}):", key=f"{col}_{i}")
+                    row_data[col] = value
+                new_data.append(row_data)
+
+            if st.form_submit_button("Stage Rows"):
+                # Rows left completely empty are not added
+                rows = [row for row in new_data if any(row.values())]
+                if rows:
+                    pending.append({'op': 'append_rows', 'rows': rows})
+                    st.rerun()
+
+    # Pending changes, committed together in a single write
+    st.header("Pending Changes")
+    if pending:
+        for op in pending:
+            st.write(f"- {describe_change(op)}")
+
+        apply_col, discard_col = st.columns(2)
+        if apply_col.button("Apply Changes", use_container_width=True):
+            store.apply({'op': 'batch', 'ops': pending})
+            st.session_state.pending_changes = []
+            st.rerun()
+        if discard_col.button("Discard Changes", use_container_width=True):
+            st.session_state.pending_changes = []
+            st.rerun()
+    else:
+        st.write("No pending changes.")
+
+    # Display the DataFrame, including any pending changes
+    st.header("Updated DataFrame" if not pending else "Preview with Pending Changes")
+    st.write(preview)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,83 @@
+import math
+import numpy as np
+
+# Point reduction for charts.
+#
+# Line charts keep the points that preserve each series' shape (LTTB or
+# min/max per bucket), bar charts aggregate consecutive rows into at most
+# `limit` bars. Either way each series sends at most `limit` points to the
+# browser.
+
+
+# Function to pick n_out points of y with Largest-Triangle-Three-Buckets
+# Returns positions into y; the first and last points are always kept
+def lttb(y, n_out):
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.arange(n, dtype=float)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0] = 0
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            next_start, next_end = edges[i + 1], edges[i + 2]
+        else:
+            next_start, next_end = n - 1, n
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+        # Area of the triangle formed with the last kept point and the next bucket's average
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(area)) if end > start else start
+        selected[i + 1] = a
+    selected[-1] = n - 1
+    return np.unique(selected)
+
+
+# Function to keep the minimum and maximum of y in each of n_out / 2 buckets
+def minmax(y, n_out):
+    n = len(y)
+    if n_out >= n or n_out < 2:
+        return np.arange(n)
+    edges = np.linspace(0, n, n_out // 2 + 1).astype(int)
+    selected = []
+    for start, end in zip(edges[:-1], edges[1:]):
+        if end > start:
+            selected.append(start + int(np.argmin(y[start:end])))
+            selected.append(start + int(np.argmax(y[start:end])))
+    return np.unique(selected)
+
+
+# Function to reduce the numeric columns of df for a line chart
+# Each column gets an equal share of `limit` rows; the union of the rows each
+# column keeps is returned, so every series shows at most `limit` points
+def downsample_lines(df, limit, method='LTTB'):
+    if len(df) <= limit or df.empty:
+        return df
+    pick = lttb if method == 'LTTB' else minmax
+    per_column = max(3, limit // max(1, len(df.columns)))
+    keep = []
+    for col in df.columns:
+        values = df[col].to_numpy(dtype=float, na_value=np.nan)
+        present = np.flatnonzero(~np.isnan(values))
+        keep.append(present[pick(values[present], per_column)])
+    return df.iloc[np.unique(np.concatenate(keep))] if keep else df
+
+
+# Function to aggregate consecutive rows of df into at most `limit` bars
+# Each bar is labelled with the index of its first row
+def aggregate_bars(df, limit, how='sum'):
+    if len(df) <= limit or df.empty:
+        return df
+    size = math.ceil(len(df) / limit)
+    buckets = np.arange(len(df)) // size
+    bars = df.groupby(buckets).agg(how)
+    bars.index = df.index[::size][:len(bars)]
+    return bars
+
+
+# Function to count the points a chart of df would draw
+def count_points(df):
+    return int(df.count().sum()) if not df.empty else 0
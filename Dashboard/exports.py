@@ -0,0 +1,68 @@
+import os
+import io
+import hashlib
+import streamlit as st
+from uploads import FrameCache
+
+# Download exports, generated when the download button is clicked.
+#
+# st.download_button takes a callable (export_data) that Streamlit only runs
+# on click, so reruns do no export work. Each export is built in memory and
+# cached by dataset fingerprint, filter state, name and format. The exports
+# are rollups of the filtered data (a row per category, region or month), so
+# they stay small however many orders there are.
+
+EXPORT_CACHE_BYTES = int(os.environ.get('EXPORT_CACHE_BYTES', 64 * 1024 * 1024))
+
+# Format -> (file extension, MIME type)
+EXPORT_FORMATS = {
+    "CSV": (".csv", "text/csv"),
+    "CSV (gzip)": (".csv.gz", "application/gzip"),
+    "Parquet": (".parquet", "application/vnd.apache.parquet"),
+}
+
+_exports = FrameCache(EXPORT_CACHE_BYTES)
+
+
+# Function to get the cache key of an export
+def export_key(fingerprint, name, filters, fmt):
+    return hashlib.sha1(repr((fingerprint, name, filters, fmt)).encode('utf-8')).hexdigest()
+
+
+# Function to get the file name of an export, e.g. "Category.csv.gz"
+def export_file_name(name, fmt):
+    return name + EXPORT_FORMATS[fmt][0]
+
+
+# Function to build an export of df as bytes in the given format
+def build_export(df, fmt):
+    buffer = io.BytesIO()
+    if fmt == "Parquet":
+        df.to_parquet(buffer, index=False)
+    else:
+        df.to_csv(buffer, index=False, compression='gzip' if fmt == "CSV (gzip)" else None)
+    return buffer.getvalue()
+
+
+# Function to get the data argument of st.download_button for an export of df
+# filters is anything describing the filter state df was selected with; it is
+# only used in the cache key. Nothing is generated until the button is clicked.
+def export_data(df, fingerprint, name, filters, fmt):
+    # Without a fingerprint the key would not identify the data, so nothing is reused
+    key = export_key(fingerprint, name, filters, fmt) if fingerprint is not None else None
+
+    def generate():
+        data = _exports.get(key) if key is not None else None
+        if data is None:
+            data = build_export(df, fmt)
+            if key is not None:
+                _exports.put(key, data)
+        return data
+    return generate
+
+
+# Function to show a format picker and a download button for an export of df
+def export_button(df, fingerprint, name, filters, key, **kwargs):
+    fmt = st.selectbox("Format", list(EXPORT_FORMATS), key=f"{key}_format")
+    st.download_button("Download Data", data=export_data(df, fingerprint, name, filters, fmt),
+                       file_name=export_file_name(name, fmt), mime=EXPORT_FORMATS[fmt][1], key=key, **kwargs)
@@ -0,0 +1,145 @@
+import os
+import io
+import hashlib
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+import matplotlib
+import pandas as pd
+from uploads import FrameCache
+from charts import close_figure
+
+# Rendered chart cache shared by every session in the process.
+#
+# Charts are saved as PNG images keyed by the dataset fingerprint (the
+# upload's content hash), the chart type and every option that changes the
+# drawing. A rerun caused by an unrelated widget then serves the image
+# instead of drawing the chart again. Images are evicted least recently used
+# first once they take more than FIGURE_CACHE_BYTES, and every figure is
+# closed right after it is saved.
+#
+# Charts that are not cached are drawn in a pool of CHART_WORKERS processes
+# using the headless Agg backend, so a page with several charts takes about
+# as long as its slowest chart. With CHART_WORKERS=0 they are drawn in the
+# script thread.
+
+FIGURE_CACHE_BYTES = int(os.environ.get('FIGURE_CACHE_BYTES', 64 * 1024 * 1024))
+FIGURE_DPI = 144
+CHART_WORKERS = int(os.environ.get('CHART_WORKERS', min(4, os.cpu_count() or 1)))
+
+_images = FrameCache(FIGURE_CACHE_BYTES)
+_pool = None
+_pool_lock = threading.Lock()
+
+
+# Function to build the cache key of a chart
+# source is a DataFrame read through read_upload, or the fingerprint itself;
+# returns None when there is no fingerprint, and the chart is then not cached
+def chart_key(source, chart, **params):
+    fingerprint = source.attrs.get('fingerprint') if isinstance(source, pd.DataFrame) else source
+    if fingerprint is None:
+        return None
+    return hashlib.sha1(repr((fingerprint, chart, sorted(params.items()))).encode()).hexdigest()
+
+
+# Function to draw a figure and save it as PNG bytes, closing it afterwards
+def render_png(draw, *args, **kwargs):
+    fig = draw(*args, **kwargs)
+    try:
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format='png', dpi=FIGURE_DPI, bbox_inches='tight')
+        return buffer.getvalue()
+    finally:
+        close_figure(fig)
+
+
+# A chart waiting to be drawn into its placeholder (an st.empty() slot)
+# draw and args must be picklable, so draw is one of the charts.draw_* functions.
+# Arguments that take a pass over the rows are given as build(), which returns
+# them and is only called when the image is not cached.
+class ChartJob:
+    def __init__(self, slot, key, draw, *args, build=None):
+        self.slot = slot
+        self.key = key
+        self.draw = draw
+        self.args = args
+        self.build = build
+
+    # Function to get the draw arguments, building them the first time
+    def arguments(self):
+        if self.build is not None:
+            self.args, self.build = tuple(self.build()), None
+        return self.args
+
+
+# Function to make worker processes draw with the headless backend
+def use_agg():
+    matplotlib.use('Agg')
+
+
+# Function to get the process pool shared by every session, None when charts are drawn in the script thread
+def get_pool():
+    global _pool
+    if CHART_WORKERS < 2:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            # spawn, since forking the multi-threaded Streamlit server is not safe
+            _pool = ProcessPoolExecutor(CHART_WORKERS, mp_context=multiprocessing.get_context('spawn'), initializer=use_agg)
+        return _pool
+
+
+# Function to forget a pool whose workers died, a new one is started on the next render
+def reset_pool(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+# Function to fill a job's slot with its image, or with the error that stopped it being drawn
+def show_job(job, png=None, error=None):
+    if error is not None:
+        job.slot.error(f"Could not draw chart: {error}")
+        return
+    if job.key is not None:
+        _images.put(job.key, png)
+    job.slot.image(png)
+
+
+# Function to draw charts into their slots
+# Cached charts are shown at once; the rest are drawn in the worker pool and
+# each is shown as soon as it is ready
+def render_charts(jobs):
+    pending = []
+    for job in jobs:
+        png = _images.get(job.key) if job.key is not None else None
+        if png is not None:
+            job.slot.image(png)
+        else:
+            pending.append(job)
+
+    pool = get_pool() if len(pending) > 1 else None
+    if pool is not None:
+        try:
+            futures = {pool.submit(render_png, job.draw, *job.arguments()): job for job in pending}
+            for future in as_completed(futures):
+                job = futures[future]
+                try:
+                    show_job(job, future.result())
+                except BrokenProcessPool:
+                    raise
+                except Exception as error:
+                    show_job(job, error=error)
+                pending.remove(job)
+        except BrokenProcessPool:
+            # A worker died (e.g. out of memory); draw what is left here
+            reset_pool(pool)
+
+    for job in pending:
+        try:
+            show_job(job, render_png(job.draw, *job.arguments()))
+        except Exception as error:
+            show_job(job, error=error)
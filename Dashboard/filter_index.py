@@ -0,0 +1,99 @@
+import os
+import numpy as np
+import pandas as pd
+from uploads import FrameCache
+
+# Filter index for the "Filter by" controls.
+#
+# The first time a column is used as a filter, its values are factorized
+# into integer codes and the row positions of each value are grouped
+# together (one sorted position list per value). The option list, the rows
+# of any set of values and the value counts are then answered from the index
+# instead of scanning the column again with unique()/isin() on every rerun.
+# Indexes are shared between sessions, keyed by the dataset fingerprint.
+
+FILTER_INDEX_BYTES = int(os.environ.get('FILTER_INDEX_BYTES', 256 * 1024 * 1024))
+
+_indexes = FrameCache(FILTER_INDEX_BYTES)
+
+
+# Row positions of every value of one column
+#   values      distinct values in order of first appearance (like Series.unique)
+#   order       row positions sorted by value code, ascending within each value
+#   offsets     rows of value k are order[offsets[k]:offsets[k + 1]]
+class ColumnIndex:
+    def __init__(self, series):
+        codes, uniques = pd.factorize(series, use_na_sentinel=False)
+        self.values = list(uniques)
+        self.codes = {value: code for code, value in enumerate(self.values) if not pd.isna(value)}
+        self.na_code = next((code for code, value in enumerate(self.values) if pd.isna(value)), None)
+        self.order = np.argsort(codes, kind='stable')
+        self.counts = np.bincount(codes, minlength=len(self.values))
+        self.offsets = np.concatenate([[0], np.cumsum(self.counts)])
+
+    def nbytes(self):
+        return self.order.nbytes + self.counts.nbytes + self.offsets.nbytes + 64 * len(self.values)
+
+    # Function to get the codes of the selected values, unknown values are ignored
+    def codes_of(self, values):
+        codes = []
+        for value in values:
+            code = self.na_code if pd.isna(value) else self.codes.get(value)
+            if code is not None:
+                codes.append(code)
+        return sorted(set(codes))
+
+    # Function to get the sorted row positions holding any of the values
+    def positions(self, values):
+        slices = [self.order[self.offsets[code]:self.offsets[code + 1]] for code in self.codes_of(values)]
+        if len(slices) == 1:
+            return slices[0]
+        return np.sort(np.concatenate(slices)) if slices else np.empty(0, dtype=np.intp)
+
+
+# Column indexes of one dataset, each built the first time it is needed
+class FilterIndex:
+    def __init__(self, fingerprint=None):
+        self.fingerprint = fingerprint
+        self.columns = {}
+
+    def nbytes(self):
+        return sum(column.nbytes() for column in self.columns.values())
+
+    def column(self, df, column):
+        if column not in self.columns:
+            self.columns[column] = ColumnIndex(df[column])
+            if self.fingerprint is not None:
+                _indexes.put(self.fingerprint, self)  # Update its size in the cache
+        return self.columns[column]
+
+    # Function to get the distinct values of a column for a multiselect
+    def options(self, df, column):
+        return self.column(df, column).values
+
+    # Function to get the rows of df where column holds one of the values; all rows when no values are given
+    def select(self, df, column, values):
+        if not values:
+            return df
+        return df.iloc[self.column(df, column).positions(values)]
+
+    # Function to count the rows per value of a column, like value_counts() on the selected rows
+    def value_counts(self, df, column, values=None):
+        index = self.column(df, column)
+        codes = index.codes_of(values) if values else range(len(index.values))
+        codes = [code for code in codes if code != index.na_code]
+        counts = pd.Series(index.counts[codes], index=[index.values[code] for code in codes], name='count')
+        return counts[counts > 0].sort_values(ascending=False, kind='stable')
+
+
+# Function to get the shared filter index of a dataset
+# A DataFrame without a fingerprint gets a new index that is not shared
+def get_filter_index(df):
+    fingerprint = df.attrs.get('fingerprint')
+    if fingerprint is None:
+        return FilterIndex()
+    index = _indexes.get(fingerprint)
+    if index is None:
+        index = FilterIndex(fingerprint)
+        _indexes.put(fingerprint, index)
+    return index
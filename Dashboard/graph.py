@@ -1,17 +1,27 @@
 import streamlit as st
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
+import charts
+from uploads import read_upload
+from chunked import read_csv_chunked
+from figcache import ChartJob, chart_key, render_charts
+from filter_index import get_filter_index
+
+# CSV uploads bigger than this open in large file mode by default
+LARGE_UPLOAD_BYTES = 100 * 1024 * 1024
+
+# Bar chart modes: one groupby over all Y columns, or seaborn with bootstrapped confidence intervals
+BAR_MODES = ['Aggregated', 'Seaborn (bootstrap CI)']
 
 # Function to read and display data from uploaded file
 def read_data(file):
     if file is not None:
         file_type = file.name.split('.')[-1]
         if file_type.lower() in ['csv', 'xlsx', 'xls']:
+            # Parsed uploads are cached by content hash across reruns and sessions
             if file_type.lower() == 'csv':
-                df = pd.read_csv(file)
+                df = read_upload(file, pd.read_csv)
             else:
-                df = pd.read_excel(file, engine='openpyxl')
+                df = read_upload(file, lambda f: pd.read_excel(f, engine='openpyxl'))
 
             st.write("### Data Preview:")
             st.write(df.head())
@@ -20,7 +30,60 @@ def read_data(file):
         else:
             st.error("Please upload a CSV or Excel file.")
 
+# Function to read a large CSV upload in chunks with compact dtypes
+def read_data_chunked(file):
+    progress_bar = st.progress(0.0, text="Reading file...")
+
+    def parse(f):
+        return read_csv_chunked(f, progress=lambda fraction, text: progress_bar.progress(fraction, text=text))
+
+    upload = read_upload(file, parse, variant='chunked', sidecar=False)
+    progress_bar.empty()
+
+    for col, count in upload.dropped.items():
+        st.warning(f"{count:,} values of {col} are not numbers and were left out.")
+
+    if upload.frame is not None:
+        st.write(f"### Data Preview ({upload.rows:,} rows, {upload.frame_bytes / 1024 ** 2:,.1f} MB in memory):")
+        st.write(upload.frame.head())
+    return upload
+
+# Function to plot charts from the aggregates of a file too large to keep in memory
+# Returns the chart jobs to render; the widgets and slots are created here
+def plot_aggregates(upload):
+    aggregates = upload.aggregates
+    st.warning(f"The file ({upload.rows:,} rows) is larger than the memory limit, "
+               "so charts are drawn from aggregates collected while reading it.")
+    if not aggregates.value_counts:
+        st.warning("No low-cardinality columns were found to chart.")
+        return []
+
+    jobs = []
+
+    st.write("### Bar Chart:")
+    x_column = st.selectbox("X-axis:", options=list(aggregates.group_stats), key='agg_bar_x')
+    if x_column is not None:
+        stats = aggregates.group_stats[x_column]
+        y_column = st.selectbox("Y-axis:", options=list(stats.columns.get_level_values(0).unique()), key='agg_bar_y')
+        statistic = st.selectbox("Statistic:", options=['sum', 'mean', 'count'], key='agg_bar_stat')
+        if statistic == 'mean':
+            values = stats[(y_column, 'sum')] / stats[(y_column, 'count')]
+        else:
+            values = stats[(y_column, statistic)]
+        key = chart_key(upload.fingerprint, 'aggregate_bar', x=x_column, y=y_column, statistic=statistic)
+        jobs.append(ChartJob(st.empty(), key, charts.draw_value_bars, values, x_column, f"{statistic} of {y_column}",
+                             f"Bar Chart: {statistic} of {y_column} by {x_column} (Entire Dataset)"))
+
+    st.write("### Pie Chart:")
+    column = st.selectbox("Select a column:", options=list(aggregates.value_counts), key='agg_pie_chart')
+    counts = aggregates.value_counts[column]
+    counts = counts[counts > 0]
+    key = chart_key(upload.fingerprint, 'aggregate_pie', column=column)
+    jobs.append(ChartJob(st.empty(), key, charts.draw_pie, counts, f"Pie Chart: {column}"))
+    return jobs
+
 # Function to plot data as bar chart
+# Returns the chart job to render, or None when there is nothing to draw
 def plot_bar_chart(df):
     st.write("### Bar Chart:")
     st.write("Select columns to plot:")
@@ -32,28 +95,39 @@ def plot_bar_chart(df):
         x_columns = st.multiselect("X-axis:", options=columns, default=[columns[0]], key='bar_x_axis')
         y_columns = st.multiselect("Y-axis:", options=columns, default=[columns[1]], key='bar_y_axis')
 
-        # Filter data based on selected columns
+        # Filter data based on selected columns; options and rows come from the dataset's filter index
+        index = get_filter_index(df)
         filter_column = st.selectbox("Filter by:", options=columns, key='bar_filter')
-        filter_values = st.multiselect(f"Select {filter_column}:", options=df[filter_column].unique(), key='bar_filter_values')
+        filter_values = st.multiselect(f"Select {filter_column}:", options=index.options(df, filter_column), key='bar_filter_values')
 
-        if not filter_values:  # If no filter values selected, use entire dataframe
-            filtered_df = df
-        else:
-            filtered_df = df[df[filter_column].isin(filter_values)]
+        # Aggregated mode groups once over all Y columns; seaborn bootstraps every row and is much slower
+        mode = st.radio("Bar mode:", options=BAR_MODES, horizontal=True, key='bar_mode')
+        if mode == BAR_MODES[0]:
+            statistic = st.selectbox("Statistic:", options=['mean', 'sum', 'count'], key='bar_statistic')
+            error_bars = st.checkbox("Show 95% error bars", value=True, key='bar_error_bars', disabled=statistic == 'count')
 
-        # Plot bar chart using Seaborn if at least one x_columns and one y_columns is selected
+        # Plot bar chart if at least one x_columns and one y_columns is selected
         if x_columns and y_columns:
-            fig, ax = plt.subplots(figsize=(10, 6))
-            for y_col in y_columns:
-                sns.barplot(x=x_columns[0], y=filtered_df[y_col], data=filtered_df, ax=ax, label=y_col)
-            ax.set_xlabel(", ".join(x_columns))
-            ax.set_ylabel(", ".join(y_columns))
             if filter_values:
-                ax.set_title(f"Bar Chart: {', '.join(y_columns)} vs {', '.join(x_columns)} (Filtered by {filter_column}={', '.join(filter_values)})")
+                title = f"Bar Chart: {', '.join(y_columns)} vs {', '.join(x_columns)} (Filtered by {filter_column}={', '.join(map(str, filter_values))})"
             else:
-                ax.set_title(f"Bar Chart: {', '.join(y_columns)} vs {', '.join(x_columns)} (Entire Dataset)")
-            ax.legend()
-            st.pyplot(fig)
+                title = f"Bar Chart: {', '.join(y_columns)} vs {', '.join(x_columns)} (Entire Dataset)"
+            # The chart is only drawn again when the data or one of these options changes;
+            # the rows are only selected (no filter values: the entire dataframe) when it is,
+            # and only the plotted columns are sent to the worker drawing it
+            def plotted_df():
+                filtered_df = index.select(df, filter_column, filter_values)
+                return filtered_df[list(dict.fromkeys([x_columns[0]] + y_columns))]
+
+            if mode == BAR_MODES[0]:
+                key = chart_key(df, 'bar', x=x_columns, y=y_columns, filter_column=filter_column,
+                                filter_values=filter_values, statistic=statistic, error_bars=error_bars)
+                return ChartJob(st.empty(), key, charts.draw_grouped_bars,
+                                build=lambda: (plotted_df(), x_columns[0], y_columns, statistic, error_bars, title))
+            key = chart_key(df, 'seaborn_bar', x=x_columns, y=y_columns, filter_column=filter_column,
+                            filter_values=filter_values)
+            return ChartJob(st.empty(), key, charts.draw_seaborn_bars,
+                            build=lambda: (plotted_df(), x_columns[0], y_columns, title))
         else:
             st.warning("Please select at least one X-axis and one Y-axis column to plot.")
 
@@ -61,6 +135,7 @@ def plot_bar_chart(df):
         st.warning("Please upload a valid CSV or Excel file to plot charts.")
 
 # Function to plot data as pie chart
+# Returns the chart job to render, or None when there is nothing to draw
 def plot_pie_chart(df):
     st.write("### Pie Chart:")
     if df is not None:
@@ -71,18 +146,15 @@ def plot_pie_chart(df):
         column = st.selectbox("Select a column:", options=columns, key='pie_chart')
 
         # Filter data based on selected column
-        filter_values = st.multiselect(f"Select {column}:", options=df[column].unique(), key='pie_chart_filter_values')
-
-        if not filter_values:  # If no filter values selected, use entire dataframe
-            filtered_df = df
-        else:
-            filtered_df = df[df[column].isin(filter_values)]
-
-        # Plot pie chart using Matplotlib
-        fig, ax = plt.subplots(figsize=(8, 8))
-        ax.pie(filtered_df[column].value_counts(), labels=filtered_df[column].value_counts().index, autopct='%1.1f%%', startangle=140)
-        ax.set_title(f"Pie Chart: {column} (Filtered by {column}={', '.join(filter_values)})")
-        st.pyplot(fig)
+        index = get_filter_index(df)
+        filter_values = st.multiselect(f"Select {column}:", options=index.options(df, column), key='pie_chart_filter_values')
+
+        # Plot pie chart using Matplotlib, served from the chart cache when nothing changed;
+        # the counts of the selected values (all values if none selected) come straight from the index
+        key = chart_key(df, 'pie', column=column, filter_values=filter_values)
+        return ChartJob(st.empty(), key, charts.draw_pie,
+                        build=lambda: (index.value_counts(df, column, filter_values),
+                                       f"Pie Chart: {column} (Filtered by {column}={', '.join(map(str, filter_values))})"))
     else:
         st.warning("Please upload a valid CSV or Excel file to plot charts.")
 
@@ -94,11 +166,22 @@ def main():
     uploaded_file = st.file_uploader("Choose a file", type=['csv', 'xlsx', 'xls'])
 
     if uploaded_file is not None:
-        df = read_data(uploaded_file)
+        is_csv = uploaded_file.name.lower().endswith('.csv')
+        large_mode = is_csv and st.checkbox("Large file mode (read in chunks with compact dtypes)",
+                                            value=uploaded_file.size > LARGE_UPLOAD_BYTES)
+        if large_mode:
+            upload = read_data_chunked(uploaded_file)
+            if upload.frame is None:
+                render_charts(plot_aggregates(upload))
+                return
+            df = upload.frame
+        else:
+            df = read_data(uploaded_file)
 
         if df is not None:
-            plot_bar_chart(df)
-            plot_pie_chart(df)
+            # Create every widget first, then draw the charts in parallel into their slots
+            jobs = [plot_bar_chart(df), plot_pie_chart(df)]
+            render_charts([job for job in jobs if job is not None])
 
 if __name__ == "__main__":
     main()
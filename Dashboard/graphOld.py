@@ -1,7 +1,10 @@
 import streamlit as st
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
+import charts
+from uploads import read_upload
+from figcache import ChartJob, chart_key, render_charts
+from summaries import SAMPLE_ROWS, numeric_columns, strata_columns, correlation_matrix
+from histograms import BIN_STRATEGIES, column_histogram
 import base64
 import io
 
@@ -10,10 +13,11 @@ def read_data(file):
     if file is not None:
         file_type = file.name.split('.')[-1]
         if file_type.lower() in ['csv', 'xlsx', 'xls']:
+            # Parsed uploads are cached by content hash across reruns and sessions
             if file_type.lower() == 'csv':
-                df = pd.read_csv(file)
+                df = read_upload(file, pd.read_csv)
             else:
-                df = pd.read_excel(file, engine='openpyxl')
+                df = read_upload(file, lambda f: pd.read_excel(f, engine='openpyxl'))
 
             st.write("### Data Preview:")
             st.write(df.head())
@@ -23,6 +27,7 @@ def read_data(file):
             st.error("Please upload a CSV or Excel file.")
 
 # Function to plot data as bar chart
+# Returns the chart job to render, or None when there is nothing to draw
 def plot_bar_chart(df):
     st.write("### Bar Chart:")
     st.write("Select columns to plot:")
@@ -31,17 +36,14 @@ def plot_bar_chart(df):
         x_column = st.selectbox("X-axis:", options=df.columns, key='bar_x')
         y_column = st.selectbox("Y-axis:", options=df.columns, index=1, key='bar_y')
 
-        # Plot bar chart using Seaborn
-        plt.figure(figsize=(10, 6))
-        sns.barplot(x=df[x_column], y=df[y_column])
-        plt.xlabel(x_column)
-        plt.ylabel(y_column)
-        plt.title(f"Bar Chart: {y_column} vs {x_column}")
-        st.pyplot()
+        # Plot bar chart using Seaborn, served from the chart cache when nothing changed
+        key = chart_key(df, 'bar', x=x_column, y=y_column)
+        return ChartJob(st.empty(), key, charts.draw_bar, df[x_column], df[y_column], f"Bar Chart: {y_column} vs {x_column}")
     else:
         st.warning("Please upload a valid CSV or Excel file to plot charts.")
 
 # Function to plot data as line chart
+# Returns the chart job to render, or None when there is nothing to draw
 def plot_line_chart(df):
     st.write("### Line Chart:")
     st.write("Select columns to plot:")
@@ -51,16 +53,13 @@ def plot_line_chart(df):
         y_column = st.selectbox("Y-axis:", options=df.columns, index=1, key='line_y')
 
         # Plot line chart using Matplotlib
-        plt.figure(figsize=(10, 6))
-        plt.plot(df[x_column], df[y_column], marker='o')
-        plt.xlabel(x_column)
-        plt.ylabel(y_column)
-        plt.title(f"Line Chart: {y_column} vs {x_column}")
-        st.pyplot()
+        key = chart_key(df, 'line', x=x_column, y=y_column)
+        return ChartJob(st.empty(), key, charts.draw_line, df[x_column], df[y_column], f"Line Chart: {y_column} vs {x_column}")
     else:
         st.warning("Please upload a valid CSV or Excel file to plot charts.")
 
 # Function to plot data as scatter plot
+# Returns the chart job to render, or None when there is nothing to draw
 def plot_scatter_plot(df):
     st.write("### Scatter Plot:")
     st.write("Select columns to plot:")
@@ -70,72 +69,83 @@ def plot_scatter_plot(df):
         y_column = st.selectbox("Y-axis:", options=df.columns, index=1, key='scatter_y')
 
         # Plot scatter plot using Matplotlib
-        plt.figure(figsize=(10, 6))
-        plt.scatter(df[x_column], df[y_column])
-        plt.xlabel(x_column)
-        plt.ylabel(y_column)
-        plt.title(f"Scatter Plot: {y_column} vs {x_column}")
-        st.pyplot()
+        key = chart_key(df, 'scatter', x=x_column, y=y_column)
+        return ChartJob(st.empty(), key, charts.draw_scatter, df[x_column], df[y_column], f"Scatter Plot: {y_column} vs {x_column}")
     else:
         st.warning("Please upload a valid CSV or Excel file to plot charts.")
 
 # Function to plot data as heatmap
+# Returns the chart job to render, or None when there is nothing to draw
 def plot_heatmap(df):
     st.write("### Heatmap:")
     st.write("Select columns for heatmap:")
     if df is not None:
         # Select columns for plotting
-        columns = st.multiselect("Select columns:", options=df.columns, key='heatmap')
+        columns = st.multiselect("Select columns:", options=numeric_columns(df), key='heatmap')
 
-        # Plot heatmap using Seaborn
-        plt.figure(figsize=(10, 8))
-        sns.heatmap(df[columns].corr(), annot=True, cmap='coolwarm', vmin=-1, vmax=1)
-        plt.title("Heatmap")
-        st.pyplot()
+        # Plot heatmap using Seaborn; the correlations are computed once per dataset
+        if columns:
+            key = chart_key(df, 'heatmap', columns=columns)
+            return ChartJob(st.empty(), key, charts.draw_heatmap, correlation_matrix(df, columns), "Heatmap")
     else:
         st.warning("Please upload a valid CSV or Excel file to plot charts.")
 
 # Function to plot data as histogram
+# Returns the chart job to render, or None when there is nothing to draw
 def plot_histogram(df):
     st.write("### Histogram:")
     st.write("Select a column for histogram:")
     if df is not None:
         # Select column for plotting
-        column = st.selectbox("Select a column:", options=df.columns, key='histogram')
-
-        # Plot histogram using Matplotlib
-        plt.figure(figsize=(10, 6))
-        plt.hist(df[column], bins=20, edgecolor='black')
-        plt.xlabel(column)
-        plt.ylabel("Frequency")
-        plt.title(f"Histogram: {column}")
-        st.pyplot()
+        column = st.selectbox("Select a column:", options=numeric_columns(df), key='histogram')
+        strategy = st.selectbox("Bins:", options=BIN_STRATEGIES, key='histogram_strategy')
+        bins = st.slider("Number of bins:", min_value=5, max_value=200, value=20, key='histogram_bins',
+                         disabled=strategy == 'Freedman-Diaconis')
+
+        # Plot histogram using Matplotlib; the counts are binned once per column and cached
+        if column is not None:
+            histogram = column_histogram(df, column, strategy, bins)
+            key = chart_key(df, 'histogram', column=column, strategy=strategy, bins=bins)
+            return ChartJob(st.empty(), key, charts.draw_histogram, histogram.edges, histogram.counts, column,
+                            f"Histogram: {column} ({len(histogram.counts)} bins, {strategy})")
     else:
         st.warning("Please upload a valid CSV or Excel file to plot charts.")
 
 # Function to plot data as pairplot (for multiple variables)
+# Returns the chart job to render, or None when there is nothing to draw
 def plot_pairplot(df):
     st.write("### Pairplot:")
     if df is not None:
+        # Pairplots grow with the square of the column count, so only selected numeric columns are drawn
+        numeric = numeric_columns(df)
+        columns = st.multiselect("Select numeric columns:", options=numeric, default=numeric[:4], key='pairplot_columns')
+
+        # Large datasets are drawn from a sample that keeps each group's share of rows
+        sample_rows = st.number_input("Sample when there are more rows than:", min_value=100, value=SAMPLE_ROWS, step=1000, key='pairplot_sample_rows')
+        stratify = st.selectbox("Stratify sample by:", options=[None] + strata_columns(df),
+                                format_func=lambda col: "(random sample)" if col is None else col, key='pairplot_stratify')
+        if len(df) > sample_rows:
+            st.caption(f"Drawing a sample of about {sample_rows:,} of {len(df):,} rows.")
+
         # Plot pairplot using Seaborn
-        sns.pairplot(df)
-        plt.title("Pairplot")
-        st.pyplot()
+        if columns:
+            key = chart_key(df, 'pairplot', columns=columns, sample_rows=sample_rows, stratify=stratify)
+            return ChartJob(st.empty(), key, charts.draw_pairplot,
+                            build=lambda: (df[columns + ([stratify] if stratify else [])], columns, sample_rows, stratify, "Pairplot"))
     else:
         st.warning("Please upload a valid CSV or Excel file to plot charts.")
 
 # Function to plot data as pie chart
+# Returns the chart job to render, or None when there is nothing to draw
 def plot_pie_chart(df):
     st.write("### Pie Chart:")
     if df is not None:
         # Select column for plotting
         column = st.selectbox("Select a column:", options=df.columns, key='pie_chart')
 
-        # Plot pie chart using Matplotlib
-        plt.figure(figsize=(8, 8))
-        plt.pie(df[column].value_counts(), labels=df[column].value_counts().index, autopct='%1.1f%%', startangle=140)
-        plt.title(f"Pie Chart: {column}")
-        st.pyplot()
+        # Plot pie chart using Matplotlib; the values are only counted when the chart is not cached
+        key = chart_key(df, 'pie', column=column)
+        return ChartJob(st.empty(), key, charts.draw_pie, build=lambda: (df[column].value_counts(), f"Pie Chart: {column}"))
     else:
         st.warning("Please upload a valid CSV or Excel file to plot charts.")
 
@@ -150,13 +160,10 @@ def main():
         df = read_data(uploaded_file)
 
         if df is not None:
-            plot_bar_chart(df)
-            plot_line_chart(df)
-            plot_scatter_plot(df)
-            plot_heatmap(df)
-            plot_histogram(df)
-            plot_pairplot(df)
-            plot_pie_chart(df)
+            # Create every widget first, then draw the charts in parallel into their slots
+            jobs = [plot_bar_chart(df), plot_line_chart(df), plot_scatter_plot(df), plot_heatmap(df),
+                    plot_histogram(df), plot_pairplot(df), plot_pie_chart(df)]
+            render_charts([job for job in jobs if job is not None])
 
 if __name__ == "__main__":
     main()
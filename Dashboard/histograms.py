@@ -0,0 +1,121 @@
+import os
+import math
+import numpy as np
+from uploads import FrameCache
+
+# Pre-binned histograms.
+#
+# Bin edges are chosen once per column and strategy, then the counts are
+# accumulated with NumPy chunk by chunk, so only CHUNK_ROWS values are held
+# as floats at a time. The finished counts are cached by the dataset
+# fingerprint; redrawing a histogram only needs the edges and counts.
+# Histograms with the same edges can be merged, e.g. counts built from
+# separate chunks or files.
+
+CHUNK_ROWS = int(os.environ.get('HISTOGRAM_CHUNK_ROWS', 10_000_000))
+HISTOGRAM_CACHE_BYTES = int(os.environ.get('HISTOGRAM_CACHE_BYTES', 32 * 1024 * 1024))
+
+# Quantiles (for the Quantile and Freedman-Diaconis strategies) are estimated from this many values
+EDGE_SAMPLE_ROWS = 1_000_000
+
+# Freedman-Diaconis can ask for very many narrow bins on long-tailed data
+MAX_BINS = 500
+
+BIN_STRATEGIES = ['Fixed', 'Freedman-Diaconis', 'Quantile']
+
+_histograms = FrameCache(HISTOGRAM_CACHE_BYTES)
+
+
+# Bin counts over fixed edges; values outside the edges are counted separately
+class Histogram:
+    def __init__(self, edges):
+        self.edges = np.asarray(edges, dtype=float)
+        self.counts = np.zeros(len(self.edges) - 1, dtype=np.int64)
+        self.underflow = 0
+        self.overflow = 0
+        self.missing = 0
+
+    def nbytes(self):
+        return self.edges.nbytes + self.counts.nbytes
+
+    def total(self):
+        return int(self.counts.sum())
+
+    # Function to count a chunk of values
+    def add(self, values):
+        values = np.asarray(values, dtype=float)
+        finite = values[np.isfinite(values)]
+        self.missing += len(values) - len(finite)
+        self.underflow += int(np.count_nonzero(finite < self.edges[0]))
+        self.overflow += int(np.count_nonzero(finite > self.edges[-1]))
+        self.counts += np.histogram(finite, bins=self.edges)[0]
+        return self
+
+    # Function to add the counts of a histogram with the same edges
+    def merge(self, other):
+        if not np.array_equal(self.edges, other.edges):
+            raise ValueError("Only histograms with the same bin edges can be merged")
+        self.counts += other.counts
+        self.underflow += other.underflow
+        self.overflow += other.overflow
+        self.missing += other.missing
+        return self
+
+
+# Function to go through a column CHUNK_ROWS values at a time, as floats
+def float_chunks(series, chunk_rows=CHUNK_ROWS):
+    for start in range(0, len(series), chunk_rows):
+        yield series.iloc[start:start + chunk_rows].to_numpy(dtype=float, na_value=np.nan)
+
+
+# Function to choose bin edges for a column
+# The range is found in one pass over the chunks; quantiles come from a random sample
+def bin_edges(series, strategy='Fixed', bins=20, seed=0):
+    low, high, count = math.inf, -math.inf, 0
+    for values in float_chunks(series):
+        finite = values[np.isfinite(values)]
+        if len(finite):
+            low, high = min(low, finite.min()), max(high, finite.max())
+            count += len(finite)
+    if count == 0:
+        return np.array([0.0, 1.0])
+    if low == high:
+        return np.array([low - 0.5, high + 0.5])
+
+    if strategy != 'Fixed':
+        rng = np.random.default_rng(seed)
+        positions = rng.integers(0, len(series), min(len(series), EDGE_SAMPLE_ROWS))
+        sample = series.iloc[np.sort(positions)].to_numpy(dtype=float, na_value=np.nan)
+        sample = sample[np.isfinite(sample)]
+
+    if strategy == 'Quantile' and len(sample):
+        edges = np.unique(np.quantile(sample, np.linspace(0, 1, bins + 1)))
+        edges[0], edges[-1] = low, high
+        if len(edges) >= 2:
+            return edges
+    if strategy == 'Freedman-Diaconis' and len(sample):
+        q1, q3 = np.quantile(sample, [0.25, 0.75])
+        width = 2 * (q3 - q1) / count ** (1 / 3)
+        if width > 0:
+            bins = min(MAX_BINS, max(1, math.ceil((high - low) / width)))
+    return np.linspace(low, high, bins + 1)
+
+
+# Function to build the histogram of a column in one pass over its chunks
+def compute_histogram(series, strategy='Fixed', bins=20):
+    histogram = Histogram(bin_edges(series, strategy, bins))
+    for values in float_chunks(series):
+        histogram.add(values)
+    return histogram
+
+
+# Function to get the histogram of a column of df, cached by the dataset fingerprint
+def column_histogram(df, column, strategy='Fixed', bins=20):
+    fingerprint = df.attrs.get('fingerprint')
+    key = f"{fingerprint}-{column}-{strategy}-{bins}" if fingerprint is not None else None
+    histogram = _histograms.get(key) if key is not None else None
+    if histogram is None:
+        histogram = compute_histogram(df[column], strategy, bins)
+        if key is not None:
+            _histograms.put(key, histogram)
+    return histogram
@@ -0,0 +1,213 @@
+import os
+import time
+import uuid
+import pandas as pd
+from storage import ROW_ID
+
+# Undo/redo history for the data entry apps.
+#
+# Each action records only what is needed to reverse it (column names, the
+# ids of appended rows, the old values of edited cells by row id). Undo and
+# redo are applied through the store like any other change and find their
+# rows by id, so changes other sessions made in the meantime are kept and no
+# full copy of the table is kept per session. Clearing the table is the one
+# action that needs the old data; it is saved to a snapshot file on disk
+# instead of in memory. Snapshots are deleted after SNAPSHOT_MAX_AGE seconds,
+# or sooner, oldest first, once together they take more than SNAPSHOT_BYTES.
+
+# Default memory budget for the payloads kept by one session's history
+UNDO_MEMORY_BUDGET = int(os.environ.get('UNDO_MEMORY_BUDGET', 16 * 1024 * 1024))
+
+SNAPSHOT_DIR = os.path.join('data', 'snapshots')
+SNAPSHOT_MAX_AGE = float(os.environ.get('SNAPSHOT_MAX_AGE', 24 * 60 * 60))
+SNAPSHOT_BYTES = int(os.environ.get('SNAPSHOT_BYTES', 1024 * 1024 * 1024))
+
+# Rough size of one stored cell value, used for budgeting small payloads
+CELL_BYTES = 64
+
+
+# Function to turn NumPy/pandas scalars into plain values for the JSON log
+def plain(value):
+    if pd.isna(value):
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    return value.item() if hasattr(value, 'item') else value
+
+
+# Function to turn a DataFrame slice into JSON-friendly records
+def to_records(df):
+    return [{col: plain(value) for col, value in row.items()} for row in df.to_dict('records')]
+
+
+# Function to delete snapshots older than max_age seconds, then the oldest until they fit in budget
+def prune_snapshots(max_age=SNAPSHOT_MAX_AGE, budget=SNAPSHOT_BYTES):
+    snapshots = []
+    for name in os.listdir(SNAPSHOT_DIR):
+        if name.endswith('.pkl'):
+            try:
+                stat = os.stat(os.path.join(SNAPSHOT_DIR, name))
+            except FileNotFoundError:
+                continue  # Removed by another session
+            snapshots.append((stat.st_mtime, stat.st_size, name))
+    total = sum(size for _, size, _ in snapshots)
+    oldest_kept = time.time() - max_age
+    for mtime, size, name in sorted(snapshots):
+        if total <= budget and mtime >= oldest_kept:
+            break
+        try:
+            os.remove(os.path.join(SNAPSHOT_DIR, name))
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+# Columns added by the "Add Columns" form
+class AddColumns:
+    def __init__(self, columns, default=0, types=None):
+        self.label = f"add {len(columns)} columns"
+        self.columns = list(columns)
+        self.default = default
+        self.types = types
+
+    def nbytes(self):
+        return CELL_BYTES * len(self.columns)
+
+    def undo(self, store):
+        store.apply({'op': 'drop_columns', 'columns': self.columns})
+
+    def redo(self, store):
+        store.add_columns(self.columns, default=self.default, types=self.types)
+
+    def discard(self):
+        pass
+
+
+# Rows appended under the ids returned by store.append; the rows are only kept while undone
+class AppendRows:
+    def __init__(self, row_ids):
+        self.label = f"append {len(row_ids)} rows"
+        self.row_ids = list(row_ids)
+        self.rows = None
+
+    def nbytes(self):
+        rows_bytes = 0 if self.rows is None else int(self.rows.memory_usage(deep=True).sum())
+        return rows_bytes + CELL_BYTES * len(self.row_ids)
+
+    # Rows already deleted by someone else are skipped
+    def undo(self, store):
+        with store.lock:
+            df = store.load()
+            self.rows = df.loc[df.index.intersection(self.row_ids)]
+            store.apply({'op': 'delete_rows', 'row_ids': self.row_ids})
+
+    def redo(self, store):
+        store.restore_rows(self.rows)
+        self.rows = None
+
+    def discard(self):
+        self.rows = None
+
+
+# Cell edits, added rows and deleted rows saved from st.data_editor
+# changes is what the store saved (by row id, with the ids given to added rows)
+# and df the table they were made against
+class EditCells:
+    def __init__(self, df, changes):
+        self.label = "edit table"
+        self.changes = changes
+        self.old_cells = {
+            row_id: {col: plain(df.at[int(row_id), col]) for col in values if col in df.columns}
+            for row_id, values in changes.get('edited_rows', {}).items() if int(row_id) in df.index
+        }
+        deleted_ids = [int(row_id) for row_id in changes.get('deleted_rows', []) if int(row_id) in df.index]
+        self.deleted_rows = to_records(df.loc[deleted_ids].reset_index())
+        self.added_ids = [row[ROW_ID] for row in changes.get('added_rows', [])]
+
+    def nbytes(self):
+        num_cells = sum(len(values) for values in self.changes.get('edited_rows', {}).values())
+        num_cells += sum(len(row) for row in self.changes.get('added_rows', []))
+        num_cells += sum(len(row) for row in self.deleted_rows)
+        return CELL_BYTES * (2 * num_cells + 1)
+
+    # Reverse of apply_edits: drop added rows, put deleted rows back, restore old cells
+    def undo(self, store):
+        store.apply({'op': 'batch', 'ops': [
+            {'op': 'delete_rows', 'row_ids': self.added_ids},
+            {'op': 'insert_rows', 'rows': self.deleted_rows},
+            {'op': 'edit', 'edited_rows': self.old_cells},
+        ]})
+
+    def redo(self, store):
+        store.apply_changes(self.changes)
+
+    def discard(self):
+        pass
+
+
+# Clearing the table, the old table is kept in a snapshot file
+# Undo puts the old rows back under their ids, next to rows added since
+class ClearTable:
+    def __init__(self, df):
+        self.label = "clear table"
+        os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+        prune_snapshots()
+        self.snapshot = os.path.join(SNAPSHOT_DIR, f"{uuid.uuid4().hex}.pkl")
+        df.to_pickle(self.snapshot)
+
+    def nbytes(self):
+        return CELL_BYTES
+
+    def undo(self, store):
+        if not os.path.exists(self.snapshot):
+            raise ValueError("The cleared rows are no longer kept (snapshots expire after "
+                             f"{SNAPSHOT_MAX_AGE / 3600:g} hours), so the clear can't be undone")
+        store.restore_rows(pd.read_pickle(self.snapshot))
+
+    def redo(self, store):
+        store.clear()
+
+    def discard(self):
+        if os.path.exists(self.snapshot):
+            os.remove(self.snapshot)
+
+
+# Undo and redo stacks with a memory budget; the oldest actions are dropped first
+class History:
+    def __init__(self, budget=UNDO_MEMORY_BUDGET):
+        self.budget = budget
+        self.undo_stack = []
+        self.redo_stack = []
+
+    def nbytes(self):
+        return sum(action.nbytes() for action in self.undo_stack + self.redo_stack)
+
+    def record(self, action):
+        self.undo_stack.append(action)
+        for undone in self.redo_stack:
+            undone.discard()
+        self.redo_stack = []
+        self._enforce_budget()
+
+    def undo(self, store):
+        if not self.undo_stack:
+            return None
+        action = self.undo_stack.pop()
+        action.undo(store)
+        self.redo_stack.append(action)
+        self._enforce_budget()
+        return action
+
+    def redo(self, store):
+        if not self.redo_stack:
+            return None
+        action = self.redo_stack.pop()
+        action.redo(store)
+        self.undo_stack.append(action)
+        self._enforce_budget()
+        return action
+
+    def _enforce_budget(self):
+        while self.nbytes() > self.budget and (self.undo_stack or self.redo_stack):
+            stack = self.undo_stack if self.undo_stack else self.redo_stack
+            stack.pop(0).discard()
@@ -0,0 +1,97 @@
+import pandas as pd
+
+# Column types for the data entry table.
+#
+# Types are declared when a column is added and saved next to the data, so
+# values are converted once when rows come in instead of on every chart
+# render. The stores keep the {column: type} map in a JSON file next to
+# the data. Text is stored as an Arrow-backed string column when pyarrow is
+# installed, which avoids one Python object per cell.
+
+try:
+    import pyarrow  # noqa: F401
+    TEXT_DTYPE = 'string[pyarrow]'
+except ImportError:
+    TEXT_DTYPE = 'string'
+
+# Types offered in the "Add Columns" form
+COLUMN_TYPES = ['Text', 'Integer', 'Decimal', 'Date', 'Yes/No']
+NUMERIC_TYPES = ('Integer', 'Decimal')
+
+TRUE_VALUES = {'true', 'yes', 'y', '1'}
+FALSE_VALUES = {'false', 'no', 'n', '0'}
+
+
+# Function to get the value new rows get for a column of the given type
+def default_value(type_name):
+    return 0 if type_name in NUMERIC_TYPES else None
+
+
+# Function to guess the type of a column that was added before types were declared
+def infer_type(series):
+    if pd.api.types.is_bool_dtype(series):
+        return 'Yes/No'
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return 'Date'
+    if pd.api.types.is_numeric_dtype(series):
+        # A column that only holds the 0 default has no type yet
+        if (series == 0).all():
+            return None
+        return 'Integer' if pd.api.types.is_integer_dtype(series) else 'Decimal'
+    return None
+
+
+# Function to check whether a column already has the dtype of its type
+def has_type(series, type_name):
+    dtype = series.dtype
+    if type_name == 'Integer':
+        return str(dtype) == 'Int64'
+    if type_name == 'Decimal':
+        return pd.api.types.is_float_dtype(dtype)
+    if type_name == 'Date':
+        return pd.api.types.is_datetime64_any_dtype(dtype)
+    if type_name == 'Yes/No':
+        return str(dtype) == 'boolean'
+    return isinstance(dtype, pd.StringDtype)
+
+
+# Function to convert a column to a type
+# Returns the converted values and a mask of the entries that could not be converted
+def coerce_column(series, type_name):
+    if pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series):
+        text = series.astype(TEXT_DTYPE).str.strip()
+        present = text.notna() & (text != '')
+        series = text.where(present)
+    else:
+        present = series.notna()
+
+    if type_name in NUMERIC_TYPES:
+        numbers = pd.to_numeric(series, errors='coerce')
+        if type_name == 'Integer':
+            valid = numbers.notna() & (numbers % 1 == 0)
+            return numbers.where(valid).astype('Int64'), present & ~valid
+        return numbers.astype('float64'), present & numbers.isna()
+
+    if type_name == 'Date':
+        values = pd.to_datetime(series, errors='coerce')
+        return values, present & values.isna()
+
+    if type_name == 'Yes/No':
+        lowered = series.astype(TEXT_DTYPE).str.lower()
+        values = pd.Series(pd.NA, index=series.index, dtype='boolean')
+        values[lowered.isin(TRUE_VALUES).fillna(False).astype(bool)] = True
+        values[lowered.isin(FALSE_VALUES).fillna(False).astype(bool)] = False
+        return values, present & values.isna()
+
+    return series.astype(TEXT_DTYPE), pd.Series(False, index=series.index)
+
+
+# Function to apply a schema to a DataFrame, only columns with the wrong dtype are converted
+def apply_schema(df, schema):
+    changed = [col for col, type_name in schema.items() if col in df.columns and not has_type(df[col], type_name)]
+    if not changed:
+        return df
+    df = df.copy()
+    for col in changed:
+        df[col] = coerce_column(df[col], schema[col])[0]
+    return df
@@ -0,0 +1,671 @@
+import os
+import json
+import hashlib
+import time
+import threading
+import pandas as pd
+from schema import apply_schema, default_value
+
+# Storage backends for the data entry apps.
+#
+# The default backend keeps the table as a Parquet base file plus an append
+# log of numbered entries in data/store. Appending rows writes one small
+# Parquet segment instead of rewriting the whole table, and loads use
+# memory-mapped reads. data/data.xlsx is only written on export.
+#
+# Declared column types (see schema.py) are kept in a JSON file next to the
+# data and applied to incoming rows, so loads return typed columns.
+#
+# Every row has an id, kept in the ROW_ID column of the stored files and
+# used as the index of loaded tables. Ids are handed out from a counter file
+# and never reused, so edits, deletions and undo find their rows by id even
+# when other sessions have added or removed rows in the meantime.
+#
+# Writers are serialized with a lock file, so several Streamlit processes can
+# share one store, and every file is written to a temp name and renamed into
+# place. Appends from many sessions that arrive within GROUP_COMMIT_WINDOW
+# seconds of each other are written together as one batch.
+
+DATA_DIR = 'data'
+EXCEL_PATH = os.path.join(DATA_DIR, 'data.xlsx')
+STORE_DIR = os.path.join(DATA_DIR, 'store')
+
+# Fold the append log into a new base (in the background) once it holds this many entries
+COMPACT_AFTER = 64
+
+# Column holding the row ids in the stored files (the index of loaded tables)
+ROW_ID = '_row_id'
+
+# How long the first append of a batch waits for others to join it (seconds)
+GROUP_COMMIT_WINDOW = float(os.environ.get('GROUP_COMMIT_WINDOW', 0.05))
+
+try:
+    import fcntl
+except ImportError:
+    # No flock on Windows, writers in this process are still serialized
+    fcntl = None
+
+try:
+    import pyarrow.parquet as pq
+    HAVE_PARQUET = True
+except ImportError:
+    HAVE_PARQUET = False
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+# Function to write a file atomically (write to a hidden temp file, then rename)
+# The temp file keeps the extension so writers like to_excel pick the right engine
+def atomic_write(path, write):
+    folder, name = os.path.split(path)
+    tmp_path = os.path.join(folder, f".{name}.tmp{os.path.splitext(name)[1]}")
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+# Lock shared by all writers of a store: a re-entrant thread lock for this
+# process plus an exclusive flock on a lock file for other processes
+class WriterLock:
+    def __init__(self, path):
+        self.path = path
+        self.thread_lock = threading.RLock()
+        self.depth = 0
+        self.file = None
+
+    def __enter__(self):
+        self.thread_lock.acquire()
+        if self.depth == 0:
+            self.file = open(self.path, 'a')
+            if fcntl is not None:
+                fcntl.flock(self.file, fcntl.LOCK_EX)
+        self.depth += 1
+        return self
+
+    def __exit__(self, *exc):
+        self.depth -= 1
+        if self.depth == 0:
+            if fcntl is not None:
+                fcntl.flock(self.file, fcntl.LOCK_UN)
+            self.file.close()
+            self.file = None
+        self.thread_lock.release()
+
+
+# Group commit: the first caller waits for the window to pass, then writes
+# everything submitted in the meantime with one call to flush(items), which
+# returns one result per item. Every caller returns its item's result once
+# its batch is written (or raises its error). How long the item waited for
+# its batch to start is kept per thread, see last_wait().
+class GroupCommit:
+    def __init__(self, flush, window=GROUP_COMMIT_WINDOW):
+        self.flush = flush
+        self.window = window
+        self.mutex = threading.Lock()
+        self.pending = []
+        self.leader_waiting = False
+        self.waits = threading.local()
+
+    def submit(self, item):
+        request = {'item': item, 'done': threading.Event(), 'error': None, 'result': None,
+                   'submitted': time.perf_counter(), 'started': None}
+        with self.mutex:
+            self.pending.append(request)
+            is_leader = not self.leader_waiting
+            self.leader_waiting = True
+
+        if is_leader:
+            time.sleep(self.window)
+            with self.mutex:
+                batch, self.pending = self.pending, []
+                self.leader_waiting = False
+            started = time.perf_counter()
+            for queued in batch:
+                queued['started'] = started
+            try:
+                results = self.flush([queued['item'] for queued in batch])
+                for queued, result in zip(batch, results):
+                    queued['result'] = result
+            except Exception as e:
+                for queued in batch:
+                    queued['error'] = e
+            finally:
+                for queued in batch:
+                    queued['done'].set()
+
+        request['done'].wait()
+        self.waits.seconds = request['started'] - request['submitted']
+        if request['error'] is not None:
+            raise request['error']
+        return request['result']
+
+    # Function to get how long the calling thread's last item waited for its batch to be written (seconds)
+    def last_wait(self):
+        return getattr(self.waits, 'seconds', 0.0)
+
+
+# Function to hash a file's contents
+def file_digest(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# Function to write a JSON log entry
+def _write_json(path, obj):
+    with open(path, 'w') as f:
+        json.dump(obj, f, default=str)
+
+
+# Function to make a DataFrame safe to write with pyarrow
+def arrow_safe(df):
+    df = df.copy()
+    df.columns = [str(col) for col in df.columns]
+    for col in df.columns:
+        if df[col].dtype != object:
+            continue
+        kind = pd.api.types.infer_dtype(df[col], skipna=True)
+        if kind in ('mixed', 'mixed-integer', 'mixed-integer-float'):
+            # Text inputs mix strings with the 0 default, keep numbers numeric when possible
+            try:
+                df[col] = pd.to_numeric(df[col])
+            except (ValueError, TypeError):
+                df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    return df
+
+
+# Function to get an empty table
+def empty_table():
+    return pd.DataFrame(index=pd.RangeIndex(0, name=ROW_ID))
+
+
+# Function to turn a stored frame (ids in the ROW_ID column) into a table (ids as the index)
+# Frames stored before rows had ids are numbered in row order from first_id
+def with_row_ids(df, first_id=0):
+    if ROW_ID in df.columns:
+        return df.set_index(ROW_ID)
+    return df.set_axis(pd.RangeIndex(first_id, first_id + len(df), name=ROW_ID))
+
+
+# Function to make a frame of row records, with the ids from their ROW_ID field
+# Records without ids (e.g. a preview of staged rows) are numbered after the table's last id
+def row_frame(records, df):
+    rows = pd.DataFrame(list(records))
+    if ROW_ID in rows.columns:
+        return rows.set_index(ROW_ID)
+    first_id = int(df.index.max()) + 1 if len(df) else 0
+    return rows.set_axis(pd.RangeIndex(first_id, first_id + len(rows), name=ROW_ID))
+
+
+# Function to split the ids given to a batch of appended frames into one list per frame
+def split_row_ids(row_ids, frames):
+    split, start = [], 0
+    for frame in frames:
+        split.append(row_ids[start:start + len(frame)].tolist())
+        start += len(frame)
+    return split
+
+
+# Function to join stored frames into one table in id order
+# Segments are in id order already, except rows put back by restore_rows
+def concat_rows(frames):
+    if not frames:
+        return empty_table()
+    df = pd.concat(frames) if len(frames) > 1 else frames[0]
+    if not df.index.is_monotonic_increasing:
+        df = df.sort_index(kind='stable')
+    return df
+
+
+# Function to apply a logged (non-append) operation to a DataFrame
+def apply_op(df, op):
+    if op['op'] == 'add_columns':
+        df = df.copy()
+        for col in op['columns']:
+            if col not in df.columns:
+                df[col] = op.get('defaults', {}).get(col, op.get('default', 0))
+        return df
+    if op['op'] == 'edit':
+        return apply_edits(df, op)
+    if op['op'] == 'drop_columns':
+        return df.drop(columns=op['columns'], errors='ignore')
+    if op['op'] == 'delete_rows':
+        return df.drop(index=op['row_ids'], errors='ignore')
+    if op['op'] in ('append_rows', 'insert_rows'):
+        return insert_rows(df, row_frame(op['rows'], df))
+    if op['op'] == 'batch':
+        for sub_op in op['ops']:
+            df = apply_op(df, sub_op)
+        return df
+    raise ValueError(f"Unknown log operation: {op['op']}")
+
+
+# Function to insert rows by id; tables are kept in id order, so new ids go
+# at the end and restored rows go back where they were
+# Rows whose id is already in the table are skipped
+def insert_rows(df, rows):
+    rows = rows[~rows.index.isin(df.index)]
+    if rows.empty:
+        return df
+    combined = pd.concat([df, rows]) if len(df.columns) else rows
+    if len(df) and rows.index.min() < df.index.max():
+        combined = combined.sort_index(kind='stable')
+    return combined
+
+
+# Function to apply st.data_editor style changes (edited, added and deleted rows)
+# Edited and deleted rows are given by row id; rows that no longer exist are skipped
+def apply_edits(df, changes):
+    df = df.copy()
+    for row_id, values in changes.get('edited_rows', {}).items():
+        row_id = int(row_id)
+        if row_id not in df.index:
+            continue
+        for col, value in values.items():
+            if col not in df.columns:
+                continue
+            try:
+                df.at[row_id, col] = value
+            except (TypeError, ValueError):
+                # Value does not fit the column dtype (e.g. text in a numeric column)
+                df[col] = df[col].astype(object)
+                df.at[row_id, col] = value
+    if changes.get('deleted_rows'):
+        df = df.drop(index=[int(row_id) for row_id in changes['deleted_rows']], errors='ignore')
+    if changes.get('added_rows'):
+        df = insert_rows(df, row_frame(changes['added_rows'], df))
+    return df
+
+
+# Function to check whether st.data_editor changes contain anything to save
+def has_edits(changes):
+    return bool(changes) and any(changes.get(key) for key in ('edited_rows', 'added_rows', 'deleted_rows'))
+
+
+# Parts shared by both backends: declared column types and appends
+class BaseStore:
+    schema_path = None
+
+    # Column types are re-read only when the schema file changes
+    def get_schema(self):
+        stamp = self._schema_stamp()
+        if stamp is None:
+            return {}
+        cached = getattr(self, 'schema_cache', None)
+        if cached is None or cached[0] != stamp:
+            with open(self.schema_path) as f:
+                cached = (stamp, json.load(f))
+            self.schema_cache = cached
+        return dict(cached[1])
+
+    def _schema_stamp(self):
+        try:
+            return os.stat(self.schema_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def set_column_types(self, types):
+        with self.lock:
+            schema = self.get_schema()
+            schema.update(types)
+            atomic_write(self.schema_path, lambda tmp: _write_json(tmp, schema))
+            self.cache = None
+
+    # types maps new columns to a type from schema.COLUMN_TYPES
+    def add_columns(self, columns, default=0, types=None):
+        op = {'op': 'add_columns', 'columns': list(columns), 'default': default}
+        if types:
+            self.set_column_types(types)
+            op['defaults'] = {col: default_value(type_name) for col, type_name in types.items()}
+        self.apply(op)
+
+    # Function to hand out count new row ids, read from and saved to the counter file
+    # A store without a counter file continues after its largest id
+    def new_row_ids(self, count):
+        with self.lock:
+            try:
+                with open(self.row_ids_path) as f:
+                    first_id = json.load(f)['next']
+            except FileNotFoundError:
+                df = self.load()
+                first_id = int(df.index.max()) + 1 if len(df) else 0
+            atomic_write(self.row_ids_path, lambda tmp: _write_json(tmp, {'next': first_id + count}))
+        return pd.RangeIndex(first_id, first_id + count, name=ROW_ID)
+
+    # Function to give new rows their ids; tables that carry ids already keep them
+    def with_new_row_ids(self, df):
+        if df.index.name == ROW_ID:
+            return df
+        return df.set_axis(self.new_row_ids(len(df)))
+
+    # Function to give the rows added by an operation their ids before it is written,
+    # so replaying the operation always gives the same ids
+    def assign_row_ids(self, op):
+        if op['op'] == 'batch':
+            return dict(op, ops=[self.assign_row_ids(sub_op) for sub_op in op['ops']])
+        key = {'append_rows': 'rows', 'edit': 'added_rows'}.get(op['op'])
+        rows = op.get(key) or [] if key else []
+        missing = [row for row in rows if ROW_ID not in row]
+        if not missing:
+            return op
+        new_ids = iter(self.new_row_ids(len(missing)))
+        return dict(op, **{key: [row if ROW_ID in row else dict(row, **{ROW_ID: next(new_ids)}) for row in rows]})
+
+    # New rows are converted to the declared types once, here
+    # Returns the ids the rows were stored under
+    def append(self, new_df):
+        if new_df.empty:
+            return []
+        return self.appends.submit(apply_schema(new_df, self.get_schema()))
+
+    # Seconds the calling thread's last append waited for others to join its group commit
+    def append_wait(self):
+        return self.appends.last_wait()
+
+
+# Backend that keeps everything in a single Excel workbook (the original behaviour)
+#
+# The parsed workbook is cached for the whole process and reused while the
+# file's size and mtime are unchanged. When those change the contents are
+# hashed, so a rewrite with identical data is not parsed again either.
+class ExcelStore(BaseStore):
+    def __init__(self, path=EXCEL_PATH):
+        self.path = path
+        self.schema_path = f"{os.path.splitext(path)[0]}.schema.json"
+        self.row_ids_path = f"{os.path.splitext(path)[0]}.row_ids.json"
+        self.cache = None  # (size/mtime fingerprint, content hash, DataFrame)
+        folder, name = os.path.split(path)
+        os.makedirs(folder, exist_ok=True)
+        self.lock = WriterLock(os.path.join(folder, f".{name}.lock"))
+        self.appends = GroupCommit(self._write_appends)
+        with self.lock:
+            if not os.path.exists(path):
+                pd.DataFrame().to_excel(path, index=False)
+
+    # Changes whenever the workbook or the declared types change
+    def fingerprint(self):
+        stat = os.stat(self.path)
+        return (stat.st_size, stat.st_mtime_ns, self._schema_stamp())
+
+    def load(self):
+        fingerprint = self.fingerprint()
+        cache = self.cache
+        if cache is not None and cache[0] == fingerprint:
+            return cache[2].copy(deep=False)
+
+        digest = file_digest(self.path)
+        if cache is not None and cache[1] == digest:
+            self.cache = (fingerprint, digest, cache[2])
+            return cache[2].copy(deep=False)
+
+        df = apply_schema(with_row_ids(pd.read_excel(self.path)), self.get_schema())
+        self.cache = (fingerprint, digest, df)
+        return df.copy(deep=False)
+
+    # The row ids are written as the workbook's ROW_ID column
+    def write(self, df):
+        with self.lock:
+            df = self.with_new_row_ids(df)
+            self.cache = None
+            atomic_write(self.path, lambda tmp: df.reset_index().to_excel(tmp, index=False, engine='openpyxl'))
+
+    def _write_appends(self, frames):
+        with self.lock:
+            batch = pd.concat(frames, ignore_index=True)
+            row_ids = self.new_row_ids(len(batch))
+            self.write(insert_rows(self.load(), batch.set_axis(row_ids)))
+        return split_row_ids(row_ids, frames)
+
+    # Put rows back under their own ids, e.g. to undo a deletion
+    def restore_rows(self, rows):
+        with self.lock:
+            self.write(insert_rows(self.load(), self.with_new_row_ids(rows)))
+
+    # Returns the operation as written, with the ids given to added rows
+    def apply(self, op):
+        with self.lock:
+            op = self.assign_row_ids(op)
+            self.write(apply_op(self.load(), op))
+        return op
+
+    def apply_changes(self, changes):
+        return self.apply(dict(changes, op='edit'))
+
+    def clear(self):
+        self.write(pd.DataFrame())
+
+    def export_excel(self, path=EXCEL_PATH):
+        if os.path.abspath(path) != os.path.abspath(self.path):
+            self.load().to_excel(path, index=False)
+        return path
+
+
+# Backend that keeps a Parquet base file plus an append log
+#
+# Files in the store directory:
+#   base-<seq>.parquet   the table as of log entry <seq>
+#   log/<seq>.parquet    rows appended by entry <seq>
+#   log/<seq>.json       any other operation (e.g. added columns)
+#   schema.json          declared column types
+#   row_ids.json         the next row id to hand out
+# Loading reads the newest base and replays the log entries after it.
+#
+# The loaded table is cached for the whole process, keyed by the name, size
+# and mtime of every file in the store. Entry names carry a sequence number
+# that changes on every write, so an unchanged store is never read again.
+class ParquetStore(BaseStore):
+    def __init__(self, root=STORE_DIR, excel_path=EXCEL_PATH):
+        self.root = root
+        self.schema_path = os.path.join(root, 'schema.json')
+        self.row_ids_path = os.path.join(root, 'row_ids.json')
+        self.log_dir = os.path.join(root, 'log')
+        self.compacting = False
+        self.cache = None  # (fingerprint, DataFrame)
+        os.makedirs(self.log_dir, exist_ok=True)
+        self.lock = WriterLock(os.path.join(root, '.lock'))
+        self.appends = GroupCommit(self._write_appends)
+
+        # Import the existing workbook the first time the store is created
+        with self.lock:
+            if self._base() == (0, None) and not self._entries() and os.path.exists(excel_path):
+                self.write(with_row_ids(pd.read_excel(excel_path)))
+            elif not self._has_row_ids():
+                # Stores written before rows had ids get them once, numbered in row order
+                self.write(self.load())
+
+    def _has_row_ids(self):
+        base_seq, base_path = self._base()
+        paths = ([base_path] if base_path else []) + [path for _, path in self._entries(base_seq) if path.endswith('.parquet')]
+        return all(ROW_ID in pq.read_schema(path).names for path in paths)
+
+    def _base(self):
+        bases = [name for name in os.listdir(self.root) if name.startswith('base-') and name.endswith('.parquet')]
+        if not bases:
+            return 0, None
+        name = max(bases, key=lambda name: int(name[5:-8]))
+        return int(name[5:-8]), os.path.join(self.root, name)
+
+    def _entries(self, after=0):
+        entries = []
+        for name in os.listdir(self.log_dir):
+            seq, ext = os.path.splitext(name)
+            if ext in ('.parquet', '.json') and seq.isdigit() and int(seq) > after:
+                entries.append((int(seq), os.path.join(self.log_dir, name)))
+        return sorted(entries)
+
+    def _next_seq(self):
+        return self._last_seq() + 1
+
+    def _entry_path(self, seq, ext):
+        return os.path.join(self.log_dir, f"{seq:010d}{ext}")
+
+    def _last_seq(self):
+        base_seq, _ = self._base()
+        entries = self._entries(base_seq)
+        return entries[-1][0] if entries else base_seq
+
+    def load(self, upto=None):
+        # A compaction can remove files while we read them, start over when that happens
+        for attempt in range(5):
+            try:
+                if upto is not None:
+                    return self._load(upto)
+                return self._load_cached()
+            except FileNotFoundError:
+                if attempt == 4:
+                    raise
+
+    # Changes whenever anything in the store changes
+    def fingerprint(self):
+        for attempt in range(5):
+            try:
+                return self._fingerprint()
+            except FileNotFoundError:
+                if attempt == 4:
+                    raise
+
+    def _fingerprint(self):
+        base_seq, base_path = self._base()
+        paths = ([base_path] if base_path else []) + [path for _, path in self._entries(base_seq)]
+        fingerprint = []
+        for path in paths:
+            stat = os.stat(path)
+            fingerprint.append((os.path.basename(path), stat.st_size, stat.st_mtime_ns))
+        fingerprint.append(('schema.json', self._schema_stamp()))
+        return tuple(fingerprint)
+
+    def _load_cached(self):
+        # Fingerprint first: a write racing with the read only causes an extra reload later
+        fingerprint = self._fingerprint()
+        cache = self.cache
+        if cache is not None and cache[0] == fingerprint:
+            return cache[1].copy(deep=False)
+        df = apply_schema(self._load(), self.get_schema())
+        self.cache = (fingerprint, df)
+        return df.copy(deep=False)
+
+    def _load(self, upto=None):
+        base_seq, base_path = self._base()
+        frames = [with_row_ids(pd.read_parquet(base_path, memory_map=True))] if base_path else []
+        for seq, path in self._entries(base_seq):
+            if upto is not None and seq > upto:
+                break
+            if path.endswith('.parquet'):
+                frames.append(with_row_ids(pd.read_parquet(path, memory_map=True), sum(len(frame) for frame in frames)))
+            else:
+                with open(path) as f:
+                    op = json.load(f)
+                frames = [apply_op(concat_rows(frames), op)]
+        return concat_rows(frames)
+
+    # The row ids are written as the ROW_ID column; rows without ids get new ones
+    def write(self, df, seq=None):
+        with self.lock:
+            df = self.with_new_row_ids(df)
+            seq = self._next_seq() if seq is None else seq
+            path = os.path.join(self.root, f"base-{seq:010d}.parquet")
+            atomic_write(path, lambda tmp: arrow_safe(df.reset_index()).to_parquet(tmp, index=False))
+            self.cache = None
+            self._cleanup(seq)
+
+    # Remove bases and log entries made obsolete by the base at <seq>
+    def _cleanup(self, seq):
+        for name in os.listdir(self.root):
+            if name.startswith('base-') and name.endswith('.parquet') and int(name[5:-8]) < seq:
+                os.remove(os.path.join(self.root, name))
+        for name in os.listdir(self.log_dir):
+            entry_seq = os.path.splitext(name)[0]
+            if entry_seq.isdigit() and int(entry_seq) <= seq:
+                os.remove(os.path.join(self.log_dir, name))
+
+    def _log(self, ext, write):
+        with self.lock:
+            seq = self._next_seq()
+            atomic_write(self._entry_path(seq, ext), write)
+            self.cache = None
+            if len(self._entries(self._base()[0])) >= COMPACT_AFTER:
+                self.compact_in_background()
+
+    # One log segment for all the appends in a group commit batch
+    def _write_appends(self, frames):
+        batch = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+        with self.lock:
+            row_ids = self.new_row_ids(len(batch))
+            batch = batch.set_axis(row_ids)
+            self._log('.parquet', lambda tmp: arrow_safe(batch.reset_index()).to_parquet(tmp, index=False))
+        return split_row_ids(row_ids, frames)
+
+    # Put rows back under their own ids, e.g. to undo a deletion
+    # They are logged as a segment like appends, and loads sort them into place
+    def restore_rows(self, rows):
+        with self.lock:
+            rows = self.with_new_row_ids(rows)
+            rows = rows[~rows.index.isin(self.load().index)]
+            if not rows.empty:
+                self._log('.parquet', lambda tmp: arrow_safe(rows.reset_index()).to_parquet(tmp, index=False))
+
+    # Log any operation understood by apply_op
+    # Returns the operation as logged, with the ids given to added rows
+    def apply(self, op):
+        with self.lock:
+            op = self.assign_row_ids(op)
+            self._log('.json', lambda tmp: _write_json(tmp, op))
+        return op
+
+    # Log only the cells, rows and deletions recorded by st.data_editor (by row id)
+    def apply_changes(self, changes):
+        return self.apply({
+            'op': 'edit',
+            'edited_rows': {str(row_id): values for row_id, values in changes.get('edited_rows', {}).items()},
+            'added_rows': list(changes.get('added_rows', [])),
+            'deleted_rows': [int(row_id) for row_id in changes.get('deleted_rows', [])],
+        })
+
+    def clear(self):
+        self.write(pd.DataFrame())
+
+    # Fold the log into a new base. Entries logged while compacting are kept
+    def compact(self):
+        with self.lock:
+            seq = self._last_seq()
+            if seq == self._base()[0]:
+                return
+        df = self.load(upto=seq)
+        with self.lock:
+            if seq > self._base()[0]:
+                self.write(df, seq=seq)
+
+    def compact_in_background(self):
+        with self.lock:
+            if self.compacting:
+                return
+            self.compacting = True
+
+        def run():
+            try:
+                self.compact()
+            finally:
+                self.compacting = False
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def export_excel(self, path=EXCEL_PATH):
+        self.load().to_excel(path, index=False)
+        return path
+
+
+# Function to get the shared store for this process
+# Set DATA_BACKEND=excel to keep using data/data.xlsx directly
+def get_store():
+    backend = os.environ.get('DATA_BACKEND', 'parquet' if HAVE_PARQUET else 'excel')
+    with _stores_lock:
+        if backend not in _stores:
+            if backend == 'parquet':
+                _stores[backend] = ParquetStore()
+            elif backend == 'excel':
+                _stores[backend] = ExcelStore()
+            else:
+                raise ValueError(f"Unknown DATA_BACKEND: {backend}")
+        return _stores[backend]
@@ -0,0 +1,100 @@
+import os
+import numpy as np
+import pandas as pd
+from uploads import FrameCache
+
+# Per-dataset summaries for the wide-data charts.
+#
+# The correlation matrix of all numeric columns is computed once per dataset
+# and shared between sessions (keyed by the dataset fingerprint); a heatmap
+# of any set of columns is a slice of it. Charts that draw every row
+# (pairplots) use a stratified sample once the data has more than
+# SAMPLE_ROWS rows.
+
+SAMPLE_ROWS = int(os.environ.get('SAMPLE_ROWS', 5000))
+SUMMARY_CACHE_BYTES = int(os.environ.get('SUMMARY_CACHE_BYTES', 64 * 1024 * 1024))
+
+# Columns with at most this many distinct values can be used to stratify samples
+MAX_STRATA = 50
+
+_summaries = FrameCache(SUMMARY_CACHE_BYTES)
+
+
+# Summaries of one dataset, each computed the first time it is needed
+class DatasetSummary:
+    def __init__(self, fingerprint=None):
+        self.fingerprint = fingerprint
+        self.correlation = None
+        self.strata = None
+
+    def nbytes(self):
+        return 0 if self.correlation is None else self.correlation.size * 8
+
+    # Function to keep the cached size up to date after computing something
+    def updated(self):
+        if self.fingerprint is not None:
+            _summaries.put(self.fingerprint, self)
+
+
+# Function to get the shared summary of a dataset
+# A DataFrame without a fingerprint gets a new summary that is not shared
+def get_summary(df):
+    fingerprint = df.attrs.get('fingerprint')
+    if fingerprint is None:
+        return DatasetSummary()
+    summary = _summaries.get(fingerprint)
+    if summary is None:
+        summary = DatasetSummary(fingerprint)
+        _summaries.put(fingerprint, summary)
+    return summary
+
+
+# Function to get the numeric columns of df
+def numeric_columns(df):
+    return [col for col in df.columns
+            if pd.api.types.is_numeric_dtype(df[col]) and not pd.api.types.is_bool_dtype(df[col])]
+
+
+# Function to get the columns of df that can be used to stratify a sample
+def strata_columns(df):
+    summary = get_summary(df)
+    if summary.strata is None:
+        numeric = numeric_columns(df)
+        summary.strata = [col for col in df.columns if col not in numeric and df[col].nunique() <= MAX_STRATA]
+        summary.updated()
+    return summary.strata
+
+
+# Function to compute the correlation matrix of the numeric columns
+# Without missing values it is one matrix product (np.corrcoef), otherwise
+# pandas computes it pair by pair over the rows where both columns are present
+def compute_correlation(df):
+    columns = numeric_columns(df)
+    values = df[columns].to_numpy(dtype=float, na_value=np.nan)
+    if len(values) > 1 and not np.isnan(values).any():
+        with np.errstate(divide='ignore', invalid='ignore'):
+            matrix = np.corrcoef(values, rowvar=False)
+        return pd.DataFrame(np.atleast_2d(matrix), index=columns, columns=columns)
+    return df[columns].corr()
+
+
+# Function to get the correlation matrix of some numeric columns of df
+# The full matrix is computed once per dataset, so every column set is a slice of it
+def correlation_matrix(df, columns):
+    summary = get_summary(df)
+    if summary.correlation is None:
+        summary.correlation = compute_correlation(df)
+        summary.updated()
+    return summary.correlation.loc[columns, columns]
+
+
+# Function to take a sample of n rows, with each value of `stratify` keeping its share of rows
+# Returns df itself when it has at most n rows; rows stay in their original order
+def stratified_sample(df, n, stratify=None, seed=0):
+    if len(df) <= n:
+        return df
+    if stratify is None:
+        return df.sample(n=n, random_state=seed).sort_index()
+    fraction = n / len(df)
+    sample = df.groupby(stratify, group_keys=False, observed=True, dropna=False).sample(frac=fraction, random_state=seed)
+    return sample.sort_index()
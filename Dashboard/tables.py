@@ -1,42 +1,145 @@
 import streamlit as st
 import pandas as pd
 import os
-import copy
+import io
+import csv
+import time
+import math
+import zipfile
+import numpy as np
 import matplotlib.pyplot as plt
+from openpyxl.utils.exceptions import InvalidFileException
+from storage import get_store, has_edits
+from history import History, AddColumns, AppendRows, EditCells, ClearTable
+from schema import COLUMN_TYPES, coerce_column, default_value, infer_type
+from downsample import downsample_lines, aggregate_bars, count_points
 
-# Function to create directory and Excel file if they do not exist
+# Function to create the data directory if it does not exist
 def create_directory_and_file():
     if not os.path.exists('data'):
         os.makedirs('data')
         st.write("Created directory: data")
 
-    if not os.path.exists('data/data.xlsx'):
-        df = pd.DataFrame()
-        df.to_excel('data/data.xlsx', index=False)
-        st.write("Created new Excel file: data.xlsx")
-
 def load_data():
-    # Load existing data from data.xlsx or initialize an empty DataFrame
-    if os.path.exists('data/data.xlsx'):
-        return pd.read_excel('data/data.xlsx')
-    else:
-        return pd.DataFrame()
+    # Load existing data from the store (imports data.xlsx on first use)
+    return get_store().load()
+
+# Delimiters recognised in pasted rows
+PASTE_DELIMITERS = ',;\t|'
+
+# Function to find the delimiter of a pasted block from its first lines
+# A header without any of the delimiters is a single column, read as comma separated
+def sniff_delimiter(text):
+    sample = '\n'.join(text.splitlines()[:20])
+    header = sample.split('\n', 1)[0]
+    if not any(delimiter in header for delimiter in PASTE_DELIMITERS):
+        return ','
+    try:
+        return csv.Sniffer().sniff(sample, delimiters=PASTE_DELIMITERS).delimiter
+    except csv.Error:
+        return ','
+
+# Errors of a file or pasted block that cannot be read, reported to the user
+# (a legacy .xls needs xlrd, which raises ImportError when it is not installed)
+BULK_READ_ERRORS = (csv.Error, pd.errors.ParserError, pd.errors.EmptyDataError, ValueError, UnicodeDecodeError,
+                    zipfile.BadZipFile, InvalidFileException, ImportError)
+
+# Function to read bulk rows from an uploaded file or a pasted block
+# pandas picks the Excel engine from the file's contents (.xlsx or legacy .xls)
+def read_bulk_rows(uploaded_file, pasted_text):
+    if uploaded_file is not None:
+        if uploaded_file.name.lower().endswith('.csv'):
+            return pd.read_csv(uploaded_file)
+        return pd.read_excel(uploaded_file)
+    if pasted_text.strip():
+        return pd.read_csv(io.StringIO(pasted_text.strip()), sep=sniff_delimiter(pasted_text.strip()))
+    return None
+
+# Function to get each column's declared type (or a guess for older columns)
+def column_types(df, schema):
+    return {col: schema.get(col) or infer_type(df[col]) for col in df.columns}
+
+# Function to check new rows against the table's columns and their types
+# Returns the converted rows (in table column order) and a list of problems
+def validate_rows(new_df, df, schema):
+    new_df.columns = [str(col).strip() for col in new_df.columns]
+    if len(df.columns) == 0:
+        return new_df, []  # An empty table takes the imported columns
+
+    problems = []
+    extra = [col for col in new_df.columns if col not in df.columns]
+    if extra:
+        problems.append(f"Unknown columns: {', '.join(extra)}")
+
+    # Columns missing from the rows get their type's default (0 for untyped columns)
+    types = column_types(df, schema)
+    rows = new_df.reindex(columns=df.columns)
+    missing = [col for col in df.columns if col not in new_df.columns]
+    for col in missing:
+        rows[col] = default_value(types[col]) if types[col] else 0
+
+    # Convert typed columns once here, and report values that do not fit
+    for col in df.columns:
+        if col in missing or types[col] is None:
+            continue
+        values, bad = coerce_column(rows[col], types[col])
+        if bad.any():
+            first_rows = (np.flatnonzero(bad.to_numpy())[:5] + 1).tolist()
+            problems.append(f"Column {col}: {int(bad.sum())} values are not {types[col]} (rows {first_rows})")
+        rows[col] = values
+    return rows, problems
+
+# Tables with more rows than this open in paged editing mode
+PAGED_EDITING_ROWS = 5000
+
+# Default cap on the points each chart series sends to the browser
+MAX_CHART_POINTS = 2000
+
+# Function to reduce chart data, reusing the last result while its key is unchanged
+def reduced_chart_data(key, reduce):
+    cached = st.session_state.get('chart_data')
+    if cached is None or cached[0] != key:
+        cached = (key, reduce())
+        st.session_state.chart_data = cached
+    return cached[1]
+
+# Function to find the positions of the rows matching a search, in the requested sort order
+def search_and_sort(df, search, sort_column, descending):
+    positions = np.arange(len(df))
+    if search:
+        mask = np.zeros(len(df), dtype=bool)
+        for col in df.columns:
+            mask |= df[col].astype(str).str.contains(search, case=False, regex=False).to_numpy()
+        positions = np.flatnonzero(mask)
+    if sort_column in df.columns:
+        values = df[sort_column].iloc[positions].reset_index(drop=True)
+        positions = positions[values.sort_values(ascending=not descending, kind='stable').index.to_numpy()]
+    return positions
+
+# Function to map st.data_editor changes made on a window (by position) to the row ids in its index
+# The editor's "_index" entry of added rows is dropped, new rows get their ids from the store
+def window_changes(changes, row_ids):
+    return {
+        'edited_rows': {int(row_ids[int(pos)]): values for pos, values in changes.get('edited_rows', {}).items()},
+        'added_rows': [{col: value for col, value in row.items() if col != '_index'}
+                       for row in changes.get('added_rows', [])],
+        'deleted_rows': [int(row_ids[int(pos)]) for pos in changes.get('deleted_rows', [])],
+    }
 
 def main():
     st.title("Dynamic Data Entry to Excel")
 
     # Create directory and file if they do not exist
     create_directory_and_file()
+    store = get_store()
 
     # Load existing data from data.xlsx or initialize an empty DataFrame
     df = load_data()
 
-    # To keep the previous state of the DataFrame for undo functionality
-    if 'prev_df' not in st.session_state:
-        st.session_state.prev_df = None
-
-    def save_previous_state():
-        st.session_state.prev_df = copy.deepcopy(df)
+    # Undo/redo history of this session's changes
+    if 'history' not in st.session_state:
+        st.session_state.history = History()
+    history = st.session_state.history
 
     # Section to add columns
     st.markdown("""
@@ -79,28 +182,26 @@ def main():
 
     if num_cols > 0:
         with st.form(key='add_columns_form'):
-            new_columns = []
+            new_columns = {}
             for i in range(num_cols):
-                col_name = st.text_input(f"Enter name for Column {i+1}:", key=f"col_{i}")
+                name_col, type_col = st.columns([3, 1])
+                col_name = name_col.text_input(f"Enter name for Column {i+1}:", key=f"col_{i}")
+                col_type = type_col.selectbox("Type", COLUMN_TYPES, key=f"col_type_{i}")
                 if col_name:
-                    new_columns.append(col_name)
+                    new_columns[col_name] = col_type
             submit_button = st.form_submit_button("Add Columns", use_container_width=True)
 
             if submit_button:
                 st.session_state.add_columns_submitted = True
-                save_previous_state()
-                # Add new columns to DataFrame with default value of 0
-                for col in new_columns:
-                    if col not in df.columns:
-                        df[col] = 0  # Initialize new columns with 0
-
-                # Save updated DataFrame with new columns to data.xlsx
-                df.to_excel('data/data.xlsx', index=False)
-                st.write(f"Added {num_cols} new columns to data.xlsx")
+                # Add new columns with their type's default value (0 for numbers)
+                added_types = {col: col_type for col, col_type in new_columns.items() if col not in df.columns}
+                store.add_columns(list(added_types), types=added_types)
+                history.record(AddColumns(list(added_types), types=added_types))
+                st.write(f"Added {num_cols} new columns to the table")
                 
                 # Reload the data to ensure the DataFrame reflects the latest state
                 df = load_data()
-                st.experimental_rerun()
+                st.rerun()
             else:
                 st.session_state.add_columns_submitted = False
 
@@ -111,66 +212,162 @@ def main():
         st.session_state.add_rows_submitted = False
 
     num_rows = st.number_input("Number of Rows to Add", min_value=0, step=1, key="num_rows")
+    schema = store.get_schema()
 
     if num_rows > 0:
+        types = column_types(df, schema)
         with st.form(key='add_rows_form'):
             new_data = []
             for i in range(num_rows):
                 st.subheader(f"Row {i+1}")
                 row_data = {}
                 for col in df.columns:
-                    value = st.text_input(f"Enter value for {col} (Row {i+1}):", key=f"{col}_{i}")
-                    row_data[col] = value if value else 0  # Set value or keep 0 if input is empty
+                    label = f"Enter value for {col} (Row {i+1}):" if types[col] is None else f"Enter {types[col]} value for {col} (Row {i+1}):"
+                    value = st.text_input(label, key=f"{col}_{i}")
+                    # Set value or keep the column's default if input is empty
+                    row_data[col] = value if value else (default_value(types[col]) if types[col] else 0)
                 new_data.append(row_data)
 
             submit_button = st.form_submit_button("Add Rows", use_container_width=True)
 
             if submit_button:
                 st.session_state.add_rows_submitted = True
-                save_previous_state()
-                # Convert new data to DataFrame
-                new_df = pd.DataFrame(new_data)
+                # Convert new data to DataFrame with the declared column types
+                new_df, problems = validate_rows(pd.DataFrame(new_data), df, schema)
 
-                # Append new data to existing DataFrame
-                df = pd.concat([df, new_df], ignore_index=True)
+                if problems:
+                    st.error("No rows were added:\n\n" + "\n\n".join(problems))
+                else:
+                    # Append only the new rows to the store
+                    if not new_df.empty:
+                        history.record(AppendRows(store.append(new_df)))
+                    st.write(f"Appended {num_rows} rows of data to the table")
 
-                # Save updated DataFrame to data.xlsx
-                df.to_excel('data/data.xlsx', index=False)
-                st.write(f"Appended {num_rows} rows of data to data.xlsx")
-                
-                # Reload the data to ensure the DataFrame reflects the latest state
-                df = load_data()
-                st.experimental_rerun()
+                    # Reload the data to ensure the DataFrame reflects the latest state
+                    df = load_data()
+                    st.rerun()
             else:
                 st.session_state.add_rows_submitted = False
 
+    # Section to import many rows at once
+    st.markdown('<div class="header">Bulk Import Rows</div>', unsafe_allow_html=True)
+
+    with st.form(key='bulk_import_form'):
+        uploaded_file = st.file_uploader("Upload a CSV or Excel file", type=['csv', 'xlsx', 'xls'], key='bulk_file')
+        pasted_text = st.text_area("Or paste rows (first line is the header)", key='bulk_text')
+        import_button = st.form_submit_button("Import Rows", use_container_width=True)
+
+    if import_button:
+        start = time.perf_counter()
+        read_error = None
+        try:
+            new_df = read_bulk_rows(uploaded_file, pasted_text)
+        except BULK_READ_ERRORS as e:
+            new_df, read_error = None, e
+        if read_error is not None:
+            st.error(f"The rows could not be read: {read_error}")
+        elif new_df is None:
+            st.warning("Upload a file or paste some rows to import.")
+        else:
+            rows, problems = validate_rows(new_df, df, schema)
+            if problems:
+                st.error("Nothing was imported:\n\n" + "\n\n".join(problems))
+            elif rows.empty:
+                st.warning("The import has no rows.")
+            else:
+                history.record(AppendRows(store.append(rows)))
+                # The group commit window is spent waiting for other sessions' appends, not importing
+                elapsed = max(time.perf_counter() - start - store.append_wait(), 1e-6)
+                st.session_state.bulk_import_result = (
+                    f"Imported {len(rows):,} rows in {elapsed:.2f}s ({len(rows) / elapsed:,.0f} rows/s)")
+                st.rerun()
+
+    if 'bulk_import_result' in st.session_state:
+        st.success(st.session_state.pop('bulk_import_result'))
+
     # Section to clear the table
     if st.button("Clear Table", key="clear_table", help="Clear all data and reset the table", use_container_width=True):
-        save_previous_state()
-        df = pd.DataFrame()  # Reset DataFrame
-        df.to_excel('data/data.xlsx', index=False)
+        history.record(ClearTable(df))
+        store.clear()  # Reset the table
         st.write("Cleared all data and reset the table.")
-        st.experimental_rerun()
+        st.rerun()
 
-    # Section to undo the last change
-    if st.button("Undo", key="undo", help="Undo the last change", use_container_width=True):
-        if st.session_state.prev_df is not None:
-            df = st.session_state.prev_df
-            df.to_excel('data/data.xlsx', index=False)
-            st.write("Reverted to the previous state of the table.")
-            st.session_state.prev_df = None  # Clear the previous state after undo
-            st.experimental_rerun()
+    # Section to undo/redo changes
+    undo_col, redo_col = st.columns(2)
+    with undo_col:
+        if st.button("Undo", key="undo", help="Undo the last change", use_container_width=True):
+            try:
+                action = history.undo(store)
+            except ValueError as e:
+                action = None
+                st.error(str(e))
+            if action is not None:
+                st.write(f"Undid: {action.label}")
+                st.rerun()
+    with redo_col:
+        if st.button("Redo", key="redo", help="Redo the last undone change", use_container_width=True):
+            action = history.redo(store)
+            if action is not None:
+                st.write(f"Redid: {action.label}")
+                st.rerun()
+    st.caption(f"{len(history.undo_stack)} changes to undo, {len(history.redo_stack)} to redo "
+               f"({history.nbytes() / 1024:.1f} KB of history)")
 
     # Display the DataFrame with editable fields
     st.markdown('<div class="header">Editable DataFrame</div>', unsafe_allow_html=True)
     
+    # Large tables are edited one page at a time: searching, sorting and
+    # slicing happen here and only the visible window is sent to the browser
+    paged = st.checkbox("Paged editing", value=len(df) > PAGED_EDITING_ROWS, key="paged_editing")
+    window = df
+    window_id = "all"
+    if paged:
+        search_col, sort_col, order_col, size_col = st.columns([3, 2, 1, 1])
+        search = search_col.text_input("Search", key="editor_search")
+        sort_column = sort_col.selectbox("Sort by", ["(row order)"] + list(df.columns), key="editor_sort")
+        descending = order_col.checkbox("Descending", key="editor_descending")
+        page_size = size_col.selectbox("Rows per page", [50, 100, 500, 1000], index=1, key="editor_page_size")
+
+        # The matching row positions are kept until the data or the search/sort changes
+        view_key = (store.fingerprint(), search, sort_column, descending)
+        cached_view = st.session_state.get('editor_view')
+        if cached_view is None or cached_view[0] != view_key:
+            cached_view = (view_key, search_and_sort(df, search, sort_column, descending))
+            st.session_state.editor_view = cached_view
+        positions = cached_view[1]
+
+        num_pages = max(1, math.ceil(len(positions) / page_size))
+        page = min(st.number_input("Page", min_value=1, step=1, key="editor_page"), num_pages)
+        window = df.iloc[positions[(page - 1) * page_size:page * page_size]]
+        window_id = f"{search}|{sort_column}|{descending}|{page_size}|{page}"
+        st.caption(f"Page {page} of {num_pages}: rows {(page - 1) * page_size + 1:,}-"
+                   f"{min(page * page_size, len(positions)):,} of {len(positions):,} matching ({len(df):,} total)")
+
     # Display editable DataFrame
-    edited_df = st.data_editor(df, use_container_width=True, key='data_editor')
+    # The editor key is bumped after each save so the saved edits are not replayed,
+    # and changes with the window so edits are never applied to the wrong rows
+    if 'editor_version' not in st.session_state:
+        st.session_state.editor_version = 0
+    editor_key = f"data_editor_{st.session_state.editor_version}_{abs(hash(window_id))}"
+    st.data_editor(window, use_container_width=True, key=editor_key)
+
+    # Save button, only the edited cells and added/deleted rows are written
+    if st.button("Save", key="save_data", help="Save changes to the table"):
+        changes = window_changes(st.session_state.get(editor_key, {}), window.index)
+        if has_edits(changes):
+            history.record(EditCells(df, store.apply_changes(changes)))
+            num_cells = sum(len(values) for values in changes.get('edited_rows', {}).values())
+            st.write(f"Saved {num_cells} edited cells, {len(changes.get('added_rows', []))} added rows "
+                     f"and {len(changes.get('deleted_rows', []))} deleted rows")
+            st.session_state.editor_version += 1
+            st.rerun()
+        else:
+            st.write("No changes to save")
 
-    # Save button
-    if st.button("Save", key="save_data", help="Save changes to data.xlsx"):
-        edited_df.to_excel('data/data.xlsx', index=False)
-        st.write("Changes have been saved to data.xlsx")
+    # Export button, data.xlsx is only written on request
+    if st.button("Export to Excel", key="export_excel", help="Write the table to data/data.xlsx"):
+        path = store.export_excel()
+        st.write(f"Exported the table to {path}")
 
     # Reload the data after saving
     df = load_data()
@@ -180,16 +377,30 @@ def main():
 
     chart_type = st.selectbox("Select Chart Type", ["Line Chart", "Bar Chart", "Pie Chart"], key="chart_type")
 
+    # Columns are typed on ingest, so charts use the numeric columns as they are
+    numeric_df = df.select_dtypes('number')
+
     if not df.empty:
+        if chart_type in ("Line Chart", "Bar Chart"):
+            max_points = st.number_input("Max points per series", min_value=100, value=MAX_CHART_POINTS,
+                                         step=100, key="max_points")
         if chart_type == "Line Chart":
-            st.line_chart(df)
+            method = st.selectbox("Reduction", ["LTTB", "Min/Max"], key="line_reduction")
+            chart_df = reduced_chart_data((store.fingerprint(), chart_type, max_points, method),
+                                          lambda: downsample_lines(numeric_df, max_points, method))
+            st.line_chart(chart_df)
+            st.caption(f"Showing {count_points(chart_df):,} of {count_points(numeric_df):,} points")
         elif chart_type == "Bar Chart":
-            st.bar_chart(df)
+            how = st.selectbox("Combine rows by", ["sum", "mean", "max"], key="bar_reduction")
+            chart_df = reduced_chart_data((store.fingerprint(), chart_type, max_points, how),
+                                          lambda: aggregate_bars(numeric_df, max_points, how))
+            st.bar_chart(chart_df)
+            st.caption(f"Showing {count_points(chart_df):,} of {count_points(numeric_df):,} points")
         elif chart_type == "Pie Chart":
-            pie_columns = st.multiselect("Select Columns for Pie Chart", df.columns, key="pie_columns")
+            pie_columns = st.multiselect("Select Columns for Pie Chart", numeric_df.columns, key="pie_columns")
             if pie_columns:
                 try:
-                    pie_data = df[pie_columns].apply(pd.to_numeric, errors='coerce').sum()  # Convert and aggregate the selected columns
+                    pie_data = numeric_df[pie_columns].sum()  # Aggregate the selected columns
                     pie_data = pie_data.dropna()  # Remove NaN values
                     if not pie_data.empty:
                         fig, ax = plt.subplots()
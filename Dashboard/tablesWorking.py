@@ -1,37 +1,29 @@
 import streamlit as st
 import pandas as pd
 import os
-import copy
+from storage import get_store
+from history import History, AddColumns, AppendRows, ClearTable
 
-# Function to create directory and Excel file if they do not exist
+# Function to create the data directory if it does not exist
 def create_directory_and_file():
     if not os.path.exists('data'):
         os.makedirs('data')
         st.write("Created directory: data")
 
-    if not os.path.exists('data/data.xlsx'):
-        df = pd.DataFrame()
-        df.to_excel('data/data.xlsx', index=False)
-        st.write("Created new Excel file: data.xlsx")
-
 def main():
     st.title("Dynamic Data Entry to Excel")
 
     # Create directory and file if they do not exist
     create_directory_and_file()
 
-    # Load existing data from data.xlsx or initialize an empty DataFrame
-    if os.path.exists('data/data.xlsx'):
-        df = pd.read_excel('data/data.xlsx')
-    else:
-        df = pd.DataFrame()
-
-    # To keep the previous state of the DataFrame for undo functionality
-    if 'prev_df' not in st.session_state:
-        st.session_state.prev_df = None
+    # Load existing data from the store (imports data.xlsx on first use)
+    store = get_store()
+    df = store.load()
 
-    def save_previous_state():
-        st.session_state.prev_df = copy.deepcopy(df)
+    # Undo/redo history of this session's changes
+    if 'history' not in st.session_state:
+        st.session_state.history = History()
+    history = st.session_state.history
 
     # Section to add columns
     st.header("Add Columns to Excel")
@@ -45,16 +37,12 @@ def main():
                 if col_name:
                     new_columns.append(col_name)
             if st.form_submit_button("Add Columns"):
-                save_previous_state()
-                # Add new columns to DataFrame with default value of 0
-                for col in new_columns:
-                    if col not in df.columns:
-                        df[col] = 0  # Initialize new columns with 0
-
-                # Save updated DataFrame with new columns to data.xlsx
-                df.to_excel('data/data.xlsx', index=False)
-                st.write(f"Added {num_cols} new columns to data.xlsx")
-                st.experimental_rerun()  # Clear the inputs by rerunning the script
+                # Add new columns with default value of 0
+                added_columns = [col for col in new_columns if col not in df.columns]
+                store.add_columns(added_columns, default=0)
+                history.record(AddColumns(added_columns, default=0))
+                st.write(f"Added {num_cols} new columns to the table")
+                st.rerun()  # Clear the inputs by rerunning the script
 
     # Section to add rows
     st.header("Add Rows to Excel")
@@ -72,36 +60,39 @@ def main():
                 new_data.append(row_data)
 
             if st.form_submit_button("Add Rows"):
-                save_previous_state()
                 # Convert new data to DataFrame
                 new_df = pd.DataFrame(new_data)
 
-                # Append new data to existing DataFrame
-                df = pd.concat([df, new_df], ignore_index=True)
-
-                # Save updated DataFrame to data.xlsx
-                df.to_excel('data/data.xlsx', index=False)
-                st.write(f"Appended {num_rows} rows of data to data.xlsx")
-                st.experimental_rerun()  # Clear the inputs by rerunning the script
+                # Append only the new rows to the store
+                if not new_df.empty:
+                    history.record(AppendRows(store.append(new_df)))
+                st.write(f"Appended {num_rows} rows of data to the table")
+                st.rerun()  # Clear the inputs by rerunning the script
 
     # Section to clear the table
     if st.button("Clear Table"):
-        save_previous_state()
-        df = pd.DataFrame()  # Reset DataFrame
-        df.to_excel('data/data.xlsx', index=False)
+        history.record(ClearTable(df))
+        store.clear()  # Reset the table
         st.write("Cleared all data and reset the table.")
-        st.experimental_rerun()  # Clear the inputs by rerunning the script
-
-    # Section to undo the last change
-    if st.button("Undo") and st.session_state.prev_df is not None:
-        df = st.session_state.prev_df
-        df.to_excel('data/data.xlsx', index=False)
-        st.write("Reverted to the previous state of the table.")
-        st.session_state.prev_df = None  # Clear the previous state after undo
-        st.experimental_rerun()  # Clear the inputs by rerunning the script
+        st.rerun()  # Clear the inputs by rerunning the script
+
+    # Section to undo/redo changes
+    if st.button("Undo"):
+        try:
+            undone = history.undo(store)
+        except ValueError as e:
+            undone = None
+            st.error(str(e))
+        if undone is not None:
+            st.write("Reverted the last change to the table.")
+            st.rerun()  # Clear the inputs by rerunning the script
+
+    if st.button("Redo") and history.redo(store) is not None:
+        st.write("Reapplied the last undone change.")
+        st.rerun()  # Clear the inputs by rerunning the script
 
     # Display the updated DataFrame
-    st.header("Updated DataFrame in data.xlsx")
+    st.header("Updated DataFrame")
     st.write(df)
 
 if __name__ == "__main__":
@@ -1,29 +1,23 @@
 import streamlit as st
 import pandas as pd
 import os
+from storage import get_store
 
-# Function to create directory and Excel file if they do not exist
+# Function to create the data directory if it does not exist
 def create_directory_and_file():
     if not os.path.exists('data'):
         os.makedirs('data')
         st.write("Created directory: data")
 
-    if not os.path.exists('data/data.xlsx'):
-        df = pd.DataFrame()
-        df.to_excel('data/data.xlsx', index=False)
-        st.write("Created new Excel file: data.xlsx")
-
 def main():
     st.title("Dynamic Data Entry to Excel")
 
     # Create directory and file if they do not exist
     create_directory_and_file()
 
-    # Load existing data from data.xlsx or initialize an empty DataFrame
-    if os.path.exists('data/data.xlsx'):
-        df = pd.read_excel('data/data.xlsx')
-    else:
-        df = pd.DataFrame()
+    # Load existing data from the store (imports data.xlsx on first use)
+    store = get_store()
+    df = store.load()
 
     # Section to add columns
     st.header("Add Columns to Excel")
@@ -37,14 +31,10 @@ def main():
                 new_columns.append(col_name)
 
         if new_columns and st.button("Add Columns"):
-            # Add new columns to DataFrame with default value of 0
-            for col in new_columns:
-                if col not in df.columns:
-                    df[col] = 0  # Initialize new columns with 0
-
-            # Save updated DataFrame with new columns to data.xlsx
-            df.to_excel('data/data.xlsx', index=False)
-            st.write(f"Added {num_cols} new columns to data.xlsx")
+            # Add new columns with default value of 0
+            store.add_columns([col for col in new_columns if col not in df.columns], default=0)
+            df = store.load()
+            st.write(f"Added {num_cols} new columns to the table")
 
     # Section to add rows
     st.header("Add Rows to Excel")
@@ -64,15 +54,13 @@ def main():
             # Convert new data to DataFrame
             new_df = pd.DataFrame(new_data)
 
-            # Append new data to existing DataFrame
-            df = pd.concat([df, new_df], ignore_index=True)
-
-            # Save updated DataFrame to data.xlsx
-            df.to_excel('data/data.xlsx', index=False)
-            st.write(f"Appended {num_rows} rows of data to data.xlsx")
+            # Append only the new rows to the store
+            store.append(new_df)
+            df = store.load()
+            st.write(f"Appended {num_rows} rows of data to the table")
 
     # Display the updated DataFrame
-    st.header("Updated DataFrame in data.xlsx")
+    st.header("Updated DataFrame")
     st.write(df)
 
 if __name__ == "__main__":
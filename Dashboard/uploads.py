@@ -0,0 +1,152 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+import pandas as pd
+
+# Parsed upload cache shared by every session in the process.
+#
+# Uploads are keyed by a hash of their contents, so a rerun (or another
+# session uploading the same file) reuses the parsed DataFrame instead of
+# running read_csv/read_excel again. The cache holds at most
+# UPLOAD_CACHE_BYTES of DataFrames and evicts the least recently used ones.
+# The first parse of a file can also be saved as a Parquet sidecar in
+# data/uploads, which is much faster to read back than CSV or Excel after an
+# eviction or a restart. Sidecars are evicted least recently used first too,
+# once together they take more than SIDECAR_BYTES on disk.
+
+UPLOAD_CACHE_BYTES = int(os.environ.get('UPLOAD_CACHE_BYTES', 1024 * 1024 * 1024))
+SIDECAR_DIR = os.path.join('data', 'uploads')
+WRITE_SIDECARS = os.environ.get('UPLOAD_SIDECARS', '1') == '1'
+SIDECAR_BYTES = int(os.environ.get('UPLOAD_SIDECAR_BYTES', UPLOAD_CACHE_BYTES))
+
+# How many upload ids to remember the hash of
+MAX_REMEMBERED_DIGESTS = 256
+
+
+# Least recently used cache of DataFrames (or other values) with a budget in bytes
+class FrameCache:
+    def __init__(self, budget):
+        self.budget = budget
+        self.frames = OrderedDict()  # key -> (value, size in bytes)
+        self.nbytes = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.frames:
+                return None
+            self.frames.move_to_end(key)
+            return self.frames[key][0]
+
+    # value is a DataFrame, bytes, or any object with an nbytes() method
+    def put(self, key, value):
+        if isinstance(value, pd.DataFrame):
+            size = int(value.memory_usage(deep=True).sum())
+        elif isinstance(value, bytes):
+            size = len(value)
+        else:
+            size = value.nbytes()
+        with self.lock:
+            if key in self.frames:
+                self.nbytes -= self.frames.pop(key)[1]
+            if size > self.budget:
+                return  # Bigger than the whole budget, do not keep it
+            self.frames[key] = (value, size)
+            self.nbytes += size
+            while self.nbytes > self.budget:
+                _, (_, evicted_size) = self.frames.popitem(last=False)
+                self.nbytes -= evicted_size
+
+
+_frames = FrameCache(UPLOAD_CACHE_BYTES)
+_digests = OrderedDict()  # Streamlit upload id -> content hash
+_digests_lock = threading.Lock()
+
+
+# Function to hash an uploaded file's contents
+# Streamlit gives each upload an id, so the same upload is only hashed once
+def upload_digest(file):
+    file_id = getattr(file, 'file_id', None)
+    with _digests_lock:
+        if file_id is not None and file_id in _digests:
+            return _digests[file_id]
+    digest = hashlib.sha1(file.getbuffer()).hexdigest()
+    if file_id is not None:
+        with _digests_lock:
+            _digests[file_id] = digest
+            while len(_digests) > MAX_REMEMBERED_DIGESTS:
+                _digests.popitem(last=False)
+    return digest
+
+
+# Function to save a parsed upload as Parquet, skipped when pyarrow cannot store it
+def write_sidecar(path, df):
+    os.makedirs(SIDECAR_DIR, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    try:
+        df.to_parquet(tmp_path)
+        os.replace(tmp_path, path)
+    except (ImportError, ValueError, TypeError, NotImplementedError, OSError):
+        # e.g. no pyarrow, or object columns mixing numbers and text
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return
+    prune_sidecars()
+
+
+# Function to delete the least recently used sidecars until they fit in SIDECAR_BYTES
+# A sidecar's mtime is its last use, it is touched whenever it is read
+def prune_sidecars(budget=SIDECAR_BYTES):
+    sidecars = []
+    for name in os.listdir(SIDECAR_DIR):
+        if name.endswith('.parquet'):
+            try:
+                stat = os.stat(os.path.join(SIDECAR_DIR, name))
+            except FileNotFoundError:
+                continue  # Removed by another process
+            sidecars.append((stat.st_mtime, stat.st_size, name))
+    total = sum(size for _, size, _ in sidecars)
+    for _, size, name in sorted(sidecars):
+        if total <= budget:
+            break
+        try:
+            os.remove(os.path.join(SIDECAR_DIR, name))
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+# Function to get the parsed DataFrame for an upload
+# parse(file) is only called when the contents have not been parsed before.
+# The returned DataFrame is shared between sessions and must not be modified
+# in place. Its content hash is kept in df.attrs['fingerprint'] (or in
+# .fingerprint for results that are not DataFrames).
+# Different ways of parsing the same file are told apart by `variant`;
+# parse may return something other than a DataFrame (e.g. a ChunkedUpload),
+# in which case no sidecar is written.
+def read_upload(file, parse, variant='', sidecar=WRITE_SIDECARS):
+    digest = upload_digest(file)
+    key = f"{digest}-{variant}" if variant else digest
+    df = _frames.get(key)
+    if df is not None:
+        return df
+
+    sidecar_path = os.path.join(SIDECAR_DIR, f"{key}.parquet")
+    if sidecar and os.path.exists(sidecar_path):
+        df = pd.read_parquet(sidecar_path)
+        os.utime(sidecar_path)  # Mark it as recently used
+    else:
+        file.seek(0)
+        df = parse(file)
+        if sidecar and isinstance(df, pd.DataFrame):
+            write_sidecar(sidecar_path, df)
+
+    if isinstance(df, pd.DataFrame):
+        df.attrs['fingerprint'] = key
+    else:
+        df.fingerprint = key
+        if getattr(df, 'frame', None) is not None:
+            df.frame.attrs['fingerprint'] = key
+    _frames.put(key, df)
+    return df